@@ -0,0 +1,243 @@
+from bisect import bisect_left, bisect_right, insort
+
+#Protocol register addresses of one unit
+ADDRESS_SPACE = 0x10000
+
+
+def UnitOf(unitIDs: dict, place: str):
+    #Single unit mode shares one address space between all places
+    if not unitIDs:
+        return 0
+    return unitIDs.get(place, 1)
+
+
+class UnitSpace:
+    # Used register ranges of one unit, sorted by start address, and the free gaps between them. Gaps are
+    # kept sorted by start for neighbour lookups and by (size, start) so the best fitting gap is one bisect
+    def __init__(self, size: int = ADDRESS_SPACE):
+        self.size = size
+        self.starts = []
+        self.ends = []
+        self.keys = []
+        #Longest range, bounds how far left an overlapping range can start
+        self.longest = 0
+        self.gapStarts = []
+        self.gapEnds = {}
+        self.bySize = []
+
+    def Build(self, ranges: list):
+        # Ranges as (start, end, key) in any order, gaps are swept once from the sorted starts
+        ranges.sort(key=lambda span: span[0])
+        self.starts = [start for start, end, key in ranges]
+        self.ends = [end for start, end, key in ranges]
+        self.keys = [key for start, end, key in ranges]
+        self.longest = max((end - start for start, end, key in ranges), default=0)
+        self.gapStarts = []
+        self.gapEnds = {}
+        self.bySize = []
+        cursor = 0
+        for start, end, key in ranges:
+            if start > cursor:
+                self.AddGap(cursor, min(start, self.size))
+            cursor = max(cursor, end)
+        if cursor < self.size:
+            self.AddGap(cursor, self.size)
+
+    def Overlaps(self, start: int, end: int):
+        # Indexes of the used ranges overlapping [start, end)
+        first = bisect_right(self.starts, start - self.longest)
+        return [index for index in range(first, bisect_left(self.starts, end)) if self.ends[index] > start]
+
+    def AddGap(self, start: int, end: int):
+        insort(self.gapStarts, start)
+        self.gapEnds[start] = end
+        insort(self.bySize, (end - start, start))
+
+    def RemoveGap(self, start: int):
+        end = self.gapEnds.pop(start)
+        del self.gapStarts[bisect_left(self.gapStarts, start)]
+        del self.bySize[bisect_left(self.bySize, (end - start, start))]
+        return end
+
+    def Take(self, start: int, end: int, key: str):
+        # Mark [start, end) used, it must lie inside one free gap
+        gapStart = self.gapStarts[bisect_right(self.gapStarts, start) - 1]
+        gapEnd = self.RemoveGap(gapStart)
+        if gapStart < start:
+            self.AddGap(gapStart, start)
+        if end < gapEnd:
+            self.AddGap(end, gapEnd)
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.keys.insert(index, key)
+        self.longest = max(self.longest, end - start)
+
+    def Release(self, start: int, key: str):
+        # Free the range of key starting at start and merge it with the gaps around it. Addresses still
+        # covered by an overlapping range stay used
+        index = bisect_left(self.starts, start)
+        while self.keys[index] != key:
+            index += 1
+        end = self.ends[index]
+        del self.starts[index], self.ends[index], self.keys[index]
+        cursor = start
+        pieces = []
+        for other in self.Overlaps(start, end):
+            if self.starts[other] > cursor:
+                pieces.append((cursor, self.starts[other]))
+            cursor = max(cursor, self.ends[other])
+        if cursor < end:
+            pieces.append((cursor, end))
+        for pieceStart, pieceEnd in pieces:
+            #Gap ending at the piece, then the gap starting right after it
+            before = bisect_left(self.gapStarts, pieceStart) - 1
+            if before >= 0 and self.gapEnds[self.gapStarts[before]] == pieceStart:
+                pieceStart = self.gapStarts[before]
+                self.RemoveGap(pieceStart)
+            if pieceEnd in self.gapEnds:
+                pieceEnd = self.RemoveGap(pieceEnd)
+            self.AddGap(pieceStart, pieceEnd)
+
+    def BestFit(self, count: int):
+        # Start of the smallest free gap holding count registers, the lowest one among equal sizes
+        index = bisect_left(self.bySize, (count, -1))
+        if index == len(self.bySize):
+            return None
+        return self.bySize[index][1]
+
+    def FirstFit(self, address: int, count: int):
+        # Lowest start from address on where count free registers follow
+        index = bisect_right(self.gapStarts, address) - 1
+        if index < 0 or self.gapEnds[self.gapStarts[index]] <= address:
+            index += 1
+        while index < len(self.gapStarts):
+            start = max(self.gapStarts[index], address)
+            if self.gapEnds[self.gapStarts[index]] - start >= count:
+                return start
+            index += 1
+        return None
+
+    def End(self):
+        #First address above every used range
+        if not self.gapStarts or self.gapEnds[self.gapStarts[-1]] != self.size:
+            return self.size
+        return self.gapStarts[-1]
+
+
+class AddressAllocator:
+    # Register ranges of every device of a plant, keyed "place/device", in the address space of its unit.
+    # New devices go into the best fitting free gap and removed devices leave a gap that is reused, no other
+    # device moves. Overlaps are reported when the declarations are loaded
+    def __init__(self, unitIDs: dict = None, size: int = ADDRESS_SPACE):
+        self.unitIDs = unitIDs
+        self.size = size
+        self.units = {}
+        self.ranges = {}
+        self.Conflicts = []
+
+    def Unit(self, place: str):
+        return UnitOf(self.unitIDs, place)
+
+    def Space(self, unit: int):
+        if unit not in self.units:
+            self.units[unit] = UnitSpace(self.size)
+            self.units[unit].Build([])
+        return self.units[unit]
+
+    def Load(self, placesDecl: dict, definitions: dict):
+        # Ranges of all declared devices, returns the conflicts found: overlapping ranges, ranges outside
+        # the address space and links that cannot share a Status02 register
+        self.units = {}
+        self.ranges = {}
+        self.Conflicts = []
+        ranges = {}
+        for place, devicesDecl in placesDecl.items():
+            unit = self.Unit(place)
+            for device, deviceDecl in devicesDecl.items():
+                key = f"{place}/{device}"
+                start = deviceDecl['address']
+                end = start + definitions[deviceDecl['type']]['Registers']
+                if start < 0 or end > self.size:
+                    self.Conflicts.append(f"{key} {start}-{end - 1} is outside the address space of unit {unit}")
+                ranges.setdefault(unit, []).append((start, end, key))
+                self.ranges[key] = (unit, start, end)
+            for device, deviceDecl in devicesDecl.items():
+                #A linked device shares the Status02 register of another device of its place
+                link = deviceDecl.get('link')
+                if link is None:
+                    continue
+                if link not in devicesDecl:
+                    self.Conflicts.append(f"{place}/{device} links to missing device {link}")
+                elif not (definitions[deviceDecl['type']]['Status02'] and definitions[devicesDecl[link]['type']]['Status02']):
+                    self.Conflicts.append(f"{place}/{device} links to {link} without a Status02 register on both")
+        for unit, unitRanges in ranges.items():
+            space = UnitSpace(self.size)
+            space.Build(unitRanges)
+            self.units[unit] = space
+            for index, (start, end, key) in enumerate(zip(space.starts, space.ends, space.keys)):
+                for other in space.Overlaps(start, end):
+                    if other < index:
+                        self.Conflicts.append(f"{key} {start}-{end - 1} overlaps {space.keys[other]} "
+                                              f"{space.starts[other]}-{space.ends[other] - 1} on unit {unit}")
+        return self.Conflicts
+
+    def Allocate(self, key: str, count: int):
+        # Address of a new device in the unit of its place, None when no gap is large enough
+        unit = self.Unit(key.split('/', 1)[0])
+        space = self.Space(unit)
+        start = space.BestFit(count)
+        if start is not None:
+            space.Take(start, start + count, key)
+            self.ranges[key] = (unit, start, start + count)
+        return start
+
+    def Free(self, key: str):
+        if key in self.ranges:
+            unit, start, end = self.ranges.pop(key)
+            self.units[unit].Release(start, key)
+
+    def Rename(self, key: str, newKey: str):
+        if key in self.ranges:
+            unit, start, end = self.ranges.pop(key)
+            space = self.units[unit]
+            index = bisect_left(space.starts, start)
+            while space.keys[index] != key:
+                index += 1
+            space.keys[index] = newKey
+            self.ranges[newKey] = (unit, start, end)
+
+    def Resequence(self, keys: list):
+        # Pack the given devices of one unit in order from the lowest address they use. Ranges of other
+        # devices stay where they are and are stepped over. Returns the new address of each key
+        if not keys:
+            return {}
+        unit = self.ranges[keys[0]][0]
+        space = self.units[unit]
+        counts = [self.ranges[key][2] - self.ranges[key][1] for key in keys]
+        cursor = min(self.ranges[key][1] for key in keys)
+        for key in keys:
+            self.Free(key)
+        addresses = {}
+        for key, count in zip(keys, counts):
+            start = space.FirstFit(cursor, count)
+            if start is None:
+                start = space.FirstFit(0, count)
+            if start is None:
+                #The ranges are left half packed, the caller loads the declarations again
+                raise ValueError(f"No free range of {count} registers left for {key} on unit {unit}")
+            space.Take(start, start + count, key)
+            self.ranges[key] = (unit, start, start + count)
+            addresses[key] = start
+            cursor = start + count
+        return addresses
+
+    def Address(self, key: str):
+        return self.ranges[key][1]
+
+    def End(self):
+        # First address above every used range, across units
+        return max((space.End() for space in self.units.values()), default=0)
+
+    def __len__(self):
+        return len(self.ranges)
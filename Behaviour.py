@@ -0,0 +1,54 @@
+VECTORS = ('Status01', 'Status02')
+
+
+class BehaviourTable:
+    # Control01 edges mapped to status bit writes, compiled once per device type from the
+    # "Behaviour" list in devices.json:
+    #   {"Command": 8, "When": [["Status02", 11, 11, 1]], "Write": [["Status02", 0, 2, 2]]}
+    # Fields are [vector, start bit, end bit, value] like Vector.SetArray, "Edge" may be "Falling"
+    def __init__(self, rules: list):
+        self.rising = [[] for bit in range(16)]
+        self.falling = [[] for bit in range(16)]
+        self.RisingMask = 0
+        self.FallingMask = 0
+        for rule in rules:
+            bit = rule['Command']
+            if not 0 <= bit < 16:
+                raise ValueError(f"Behaviour command bit {bit} is outside Control01")
+            conditions = tuple(self.Field(*field) for field in rule.get('When', []))
+            writes = tuple(self.Field(*field) for field in rule.get('Write', []))
+            if rule.get('Edge', 'Rising') == 'Falling':
+                self.falling[bit].append((conditions, writes))
+                self.FallingMask |= 1 << bit
+            else:
+                self.rising[bit].append((conditions, writes))
+                self.RisingMask |= 1 << bit
+
+    @staticmethod
+    def Field(vector: str, start: int, end: int, value: int):
+        if vector not in VECTORS:
+            raise ValueError(f"Behaviour field {vector} must be one of {', '.join(VECTORS)}")
+        mask = ((1 << (end - start + 1)) - 1) << start
+        if (value << start) & ~mask:
+            raise ValueError(f"Behaviour value {value} does not fit {vector} bits {start}-{end}")
+        return VECTORS.index(vector), mask, value << start
+
+    @staticmethod
+    def Apply(table: list, edges: int, words: list):
+        while edges:
+            low = edges & -edges
+            edges ^= low
+            for conditions, writes in table[low.bit_length() - 1]:
+                if all(words[index] & mask == value for index, mask, value in conditions):
+                    for index, mask, value in writes:
+                        words[index] = (words[index] & ~mask) | value
+
+    def Evaluate(self, rising: int, falling: int, words: list):
+        #Rules run in bit order, each one sees the writes of the rules before it
+        rising &= self.RisingMask
+        falling &= self.FallingMask
+        if rising:
+            self.Apply(self.rising, rising, words)
+        if falling:
+            self.Apply(self.falling, falling, words)
+        return words
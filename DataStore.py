@@ -0,0 +1,574 @@
+import numpy as np
+from multiprocessing import shared_memory
+from pymodbus.datastore import ModbusDeviceContext
+from pymodbus.datastore.store import BaseModbusDataBlock
+from pymodbus.exceptions import ParameterException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.bit_message import ReadCoilsRequest, ReadDiscreteInputsRequest
+from pymodbus.pdu.register_message import (ReadHoldingRegistersRequest, ReadInputRegistersRequest,
+                                           ReadWriteMultipleRegistersRequest, MaskWriteRegisterRequest)
+
+# ModbusDeviceContext shifts every protocol address by one before it reaches the datablock
+CONTEXT_OFFSET = 1
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+#Registers reachable as coils / discrete inputs, 16 bits each in the 65536 bit address space
+BIT_REGISTERS = 0x10000 // 16
+
+
+class WriteHooks:
+    # Callbacks fired when a Modbus client writes a registered (protocol) address
+    def AddWriteHook(self, address: int, callback):
+        self.hooks[address] = callback
+
+    def RemoveWriteHook(self, address: int):
+        self.hooks.pop(address, None)
+
+    def Notify(self, address: int, count: int):
+        if not self.hooks:
+            return
+        if count == 1:
+            callback = self.hooks.get(address)
+            if callback:
+                callback(address)
+            return
+        #Walk the shorter of the written range and the hook table, a callback hooked on several of the
+        #written registers runs once, for the first of them
+        if count < len(self.hooks):
+            addresses = [hookAddress for hookAddress in range(address, address + count) if hookAddress in self.hooks]
+        else:
+            addresses = sorted(hookAddress for hookAddress in self.hooks if address <= hookAddress < address + count)
+        called = set()
+        for hookAddress in addresses:
+            callback = self.hooks.get(hookAddress)
+            if callback is not None and id(callback) not in called:
+                called.add(id(callback))
+                callback(hookAddress)
+
+
+class RegisterBank(WriteHooks, BaseModbusDataBlock):
+    def __init__(self, address: int, count: int, mapped: bool = True):
+        self.address = address
+        self.default_value = 0
+        self.values = np.zeros(count, dtype=np.uint16)
+        self.view = memoryview(self.values)
+        #Registers clients may access, the gaps between devices of a unit answer with an illegal address
+        self.mapped = np.full(count, mapped, dtype=bool)
+        #Change Journal
+        self.Sequence = 0
+        self.stamps = np.zeros(count, dtype=np.int64)
+        self.hooks = {}
+        self.shared = None
+
+    def Share(self):
+        # Move the registers into shared memory, worker processes attach to it by name
+        if self.shared is None:
+            self.shared = shared_memory.SharedMemory(create=True, size=max(self.values.nbytes, 1))
+            self.Rebind(True)
+        return self.shared.name
+
+    def Attach(self):
+        #Unpickled banks stay private until the worker has built its devices on them
+        if self.shared is None:
+            self.shared = shared_memory.SharedMemory(name=self.sharedName)
+            self.Rebind(False)
+
+    def Rebind(self, copy: bool):
+        values = np.ndarray(len(self.values), dtype=np.uint16, buffer=self.shared.buf)
+        if copy:
+            values[:] = self.values
+        self.values = values
+        self.view = memoryview(values)
+
+    def Release(self):
+        # Back to private registers, then close and remove the shared block
+        if self.shared is not None:
+            self.values = self.values.copy()
+            self.view = memoryview(self.values)
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+    def Map(self, address: int, count: int):
+        start = address + CONTEXT_OFFSET - self.address
+        self.mapped[start:start + count] = True
+
+    def Unmap(self, address: int, count: int):
+        start = address + CONTEXT_OFFSET - self.address
+        self.mapped[start:start + count] = False
+
+    def Resize(self, address: int, count: int):
+        # Grow the bank to cover [address, address + count) in place, registers keep their addresses.
+        # The added registers stay unmapped until they are mapped
+        if self.shared is not None:
+            raise ValueError("Shared register banks cannot be resized")
+        start = min(self.address, address)
+        stop = max(self.address + len(self.values), address + count)
+        if start == self.address and stop == self.address + len(self.values):
+            return
+        values = np.zeros(stop - start, dtype=np.uint16)
+        stamps = np.zeros(stop - start, dtype=np.int64)
+        mapped = np.zeros(stop - start, dtype=bool)
+        offset = self.address - start
+        values[offset:offset + len(self.values)] = self.values
+        stamps[offset:offset + len(self.values)] = self.stamps
+        mapped[offset:offset + len(self.values)] = self.mapped
+        self.address = start
+        self.values = values
+        self.view = memoryview(values)
+        self.stamps = stamps
+        self.mapped = mapped
+
+    def __getstate__(self):
+        #Only shared banks can be sent to a worker, the change journal and write hooks stay per process
+        if self.shared is None:
+            raise ValueError("Register bank must be shared before it is sent to another process")
+        return {'address': self.address, 'count': len(self.values), 'name': self.shared.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['address'], state['count'])
+        self.sharedName = state['name']
+
+    def reset(self):
+        self.setValues(self.address, np.full(len(self.values), self.default_value))
+
+    def validate(self, address: int, count: int = 1):
+        start = address - self.address
+        return start >= 0 and count >= 1 and start + count <= len(self.values) and bool(self.mapped[start:start + count].all())
+
+    def Stamp(self, start: int, changed):
+        if changed.any():
+            self.Sequence += 1
+            self.stamps[start:start + len(changed)][changed] = self.Sequence
+
+    #Server Access (block addresses)
+    def getValues(self, address: int, count: int = 1):
+        start = address - self.address
+        return self.view[start:start + count].tolist()
+
+    def Write(self, address: int, values):
+        start = address - self.address
+        values = np.asarray(values, dtype=np.int64) & 0xFFFF
+        block = self.values[start:start + len(values)]
+        changed = block != values
+        block[changed] = values[changed]
+        self.Stamp(start, changed)
+
+    def setValues(self, address: int, values):
+        if not isinstance(values, (list, tuple, np.ndarray)):
+            values = [values]
+        self.Write(address, values)
+        self.Notify(address - CONTEXT_OFFSET, len(values))
+
+    #Simulator Access (protocol addresses)
+    def GetRegister(self, address: int):
+        return int(self.values[address + CONTEXT_OFFSET - self.address])
+
+    def SetRegister(self, address: int, value: int):
+        index = address + CONTEXT_OFFSET - self.address
+        value &= 0xFFFF
+        if self.values[index] != value:
+            self.values[index] = value
+            self.Sequence += 1
+            self.stamps[index] = self.Sequence
+
+    def GetRegisters(self, address: int, count: int):
+        start = address + CONTEXT_OFFSET - self.address
+        return self.values[start:start + count]
+
+    def SetRegisters(self, address: int, values):
+        self.Write(address + CONTEXT_OFFSET, values)
+
+    def SetMasked(self, address: int, values, mask):
+        start = address + CONTEXT_OFFSET - self.address
+        block = self.values[start:start + len(values)]
+        changed = mask & (block != values)
+        block[changed] = values[changed]
+        self.Stamp(start, changed)
+
+    def Gather(self, addresses):
+        return self.values[addresses + CONTEXT_OFFSET - self.address]
+
+    def Scatter(self, addresses, values):
+        # Write scattered protocol addresses in one pass, stamping only the registers whose value changes
+        index = addresses + CONTEXT_OFFSET - self.address
+        changed = self.values[index] != values
+        if changed.any():
+            self.Sequence += 1
+            index = index[changed]
+            self.values[index] = values[changed]
+            self.stamps[index] = self.Sequence
+
+    def Changed(self, address: int, count: int, sequence: int):
+        start = address + CONTEXT_OFFSET - self.address
+        return bool(self.stamps[start:start + count].max(initial=0) > sequence)
+
+
+class PagedRegisterBank(WriteHooks, BaseModbusDataBlock):
+    # Sparse 0-65535 register space, fixed size pages are only allocated for mapped ranges
+    def __init__(self):
+        self.address = 0
+        self.default_value = 0
+        self.values = {}
+        pageCount = (0x10000 + CONTEXT_OFFSET + PAGE_MASK) >> PAGE_BITS
+        self.pages = [None] * pageCount
+        self.views = [None] * pageCount
+        self.mapped = [None] * pageCount
+        #Change Journal, per register stamps plus the latest stamp of each page
+        self.Sequence = 0
+        self.stamps = [None] * pageCount
+        self.pageStamps = [0] * pageCount
+        self.hooks = {}
+        self.shared = None
+
+    def Spans(self, address: int, count: int):
+        # Split a block address range into (page, start, end) slices
+        end = address + count
+        while address < end:
+            page = address >> PAGE_BITS
+            start = address & PAGE_MASK
+            stop = min(PAGE_SIZE, start + end - address)
+            yield page, start, stop
+            address += stop - start
+
+    def Map(self, address: int, count: int):
+        for page, start, stop in self.Spans(address + CONTEXT_OFFSET, count):
+            if self.pages[page] is None:
+                self.pages[page] = np.zeros(PAGE_SIZE, dtype=np.uint16)
+                self.views[page] = memoryview(self.pages[page])
+                self.mapped[page] = np.zeros(PAGE_SIZE, dtype=bool)
+                self.stamps[page] = np.zeros(PAGE_SIZE, dtype=np.int64)
+                self.values[page] = self.pages[page]
+            self.mapped[page][start:stop] = True
+
+    def Unmap(self, address: int, count: int):
+        # Clients get an illegal address again, the page itself stays allocated
+        for page, start, stop in self.Spans(address + CONTEXT_OFFSET, count):
+            if self.pages[page] is not None:
+                self.mapped[page][start:stop] = False
+
+    def Share(self):
+        # Move the mapped pages into one shared memory block, worker processes attach to it by name
+        if self.shared is None:
+            self.shared = shared_memory.SharedMemory(create=True, size=max(len(self.values), 1) * PAGE_SIZE * 2)
+            self.Rebind(True)
+        return self.shared.name
+
+    def Attach(self):
+        if self.shared is None:
+            self.shared = shared_memory.SharedMemory(name=self.sharedName)
+            self.Rebind(False)
+
+    def Rebind(self, copy: bool):
+        pages = sorted(self.values)
+        block = np.ndarray((len(pages), PAGE_SIZE), dtype=np.uint16, buffer=self.shared.buf)
+        for row, page in enumerate(pages):
+            if copy:
+                block[row] = self.pages[page]
+            self.pages[page] = block[row]
+            self.views[page] = memoryview(block[row])
+            self.values[page] = block[row]
+
+    def Release(self):
+        # Back to private pages, then close and remove the shared block
+        if self.shared is not None:
+            for page in self.values:
+                values = self.pages[page].copy()
+                self.pages[page] = values
+                self.views[page] = memoryview(values)
+                self.values[page] = values
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+    def __getstate__(self):
+        #Only shared banks can be sent to a worker, the change journal and write hooks stay per process
+        if self.shared is None:
+            raise ValueError("Register bank must be shared before it is sent to another process")
+        pages = sorted(self.values)
+        return {'pages': pages, 'mapped': [self.mapped[page] for page in pages], 'name': self.shared.name}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for page, mapped in zip(state['pages'], state['mapped']):
+            self.pages[page] = np.zeros(PAGE_SIZE, dtype=np.uint16)
+            self.views[page] = memoryview(self.pages[page])
+            self.mapped[page] = mapped
+            self.stamps[page] = np.zeros(PAGE_SIZE, dtype=np.int64)
+            self.values[page] = self.pages[page]
+        self.sharedName = state['name']
+
+    def reset(self):
+        for page in self.values:
+            self.SetMasked((page << PAGE_BITS) - CONTEXT_OFFSET, np.full(PAGE_SIZE, self.default_value, dtype=np.uint16), self.mapped[page])
+
+    def validate(self, address: int, count: int = 1):
+        if address < 0 or count < 1 or address + count > len(self.pages) * PAGE_SIZE:
+            return False
+        for page, start, stop in self.Spans(address, count):
+            if self.mapped[page] is None or not self.mapped[page][start:stop].all():
+                return False
+        return True
+
+    def Write(self, address: int, values, mask=None):
+        # Write block addresses, stamping only the registers whose value changes
+        sequence = self.Sequence + 1
+        offset = 0
+        for page, start, stop in self.Spans(address, len(values)):
+            block = self.pages[page][start:stop]
+            chunk = values[offset:offset + stop - start]
+            changed = block != chunk
+            if mask is not None:
+                changed &= mask[offset:offset + stop - start]
+            if changed.any():
+                block[changed] = chunk[changed]
+                self.stamps[page][start:stop][changed] = sequence
+                self.pageStamps[page] = sequence
+                self.Sequence = sequence
+            offset += stop - start
+
+    #Server Access (block addresses)
+    def getValues(self, address: int, count: int = 1):
+        result = []
+        for page, start, stop in self.Spans(address, count):
+            result += self.views[page][start:stop].tolist()
+        return result
+
+    def setValues(self, address: int, values):
+        if not isinstance(values, (list, tuple, np.ndarray)):
+            values = [values]
+        self.Write(address, np.asarray(values, dtype=np.int64) & 0xFFFF)
+        self.Notify(address - CONTEXT_OFFSET, len(values))
+
+    #Simulator Access (protocol addresses)
+    def GetRegister(self, address: int):
+        address += CONTEXT_OFFSET
+        return int(self.pages[address >> PAGE_BITS][address & PAGE_MASK])
+
+    def SetRegister(self, address: int, value: int):
+        address += CONTEXT_OFFSET
+        page = address >> PAGE_BITS
+        value &= 0xFFFF
+        if self.pages[page][address & PAGE_MASK] != value:
+            self.pages[page][address & PAGE_MASK] = value
+            self.Sequence += 1
+            self.stamps[page][address & PAGE_MASK] = self.Sequence
+            self.pageStamps[page] = self.Sequence
+
+    def GetRegisters(self, address: int, count: int):
+        spans = list(self.Spans(address + CONTEXT_OFFSET, count))
+        if len(spans) == 1:
+            page, start, stop = spans[0]
+            return self.pages[page][start:stop]
+        return np.concatenate([self.pages[page][start:stop] for page, start, stop in spans])
+
+    def SetRegisters(self, address: int, values):
+        self.Write(address + CONTEXT_OFFSET, np.asarray(values, dtype=np.int64) & 0xFFFF)
+
+    def SetMasked(self, address: int, values, mask):
+        self.Write(address + CONTEXT_OFFSET, values, mask)
+
+    def Gather(self, addresses):
+        # Read scattered protocol addresses, any order
+        addresses = addresses + CONTEXT_OFFSET
+        pages = addresses >> PAGE_BITS
+        values = np.zeros(len(addresses), dtype=np.uint16)
+        for page in np.unique(pages):
+            selected = pages == page
+            values[selected] = self.pages[page][addresses[selected] & PAGE_MASK]
+        return values
+
+    def Scatter(self, addresses, values):
+        # Addresses must be sorted so that each page is one contiguous run
+        if len(addresses) == 0:
+            return
+        addresses = addresses + CONTEXT_OFFSET
+        pages = addresses >> PAGE_BITS
+        bounds = np.flatnonzero(pages[1:] != pages[:-1]) + 1
+        sequence = self.Sequence + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(addresses)]):
+            page = pages[start]
+            offsets = addresses[start:stop] & PAGE_MASK
+            chunk = values[start:stop]
+            changed = self.pages[page][offsets] != chunk
+            if changed.any():
+                offsets = offsets[changed]
+                self.pages[page][offsets] = chunk[changed]
+                self.stamps[page][offsets] = sequence
+                self.pageStamps[page] = sequence
+                self.Sequence = sequence
+
+    def Changed(self, address: int, count: int, sequence: int):
+        for page, start, stop in self.Spans(address + CONTEXT_OFFSET, count):
+            if self.pageStamps[page] > sequence and self.stamps[page][start:stop].max() > sequence:
+                return True
+        return False
+
+
+class RegisterBitBlock(BaseModbusDataBlock):
+    # Coil / discrete input view onto holding register bits. Bit address = register * 16 + bit, so the
+    # address of a vector only depends on its register and survives adding or removing other devices
+    def __init__(self, bank):
+        self.bank = bank
+        self.address = CONTEXT_OFFSET
+        self.default_value = False
+        self.values = set()
+
+    def Map(self, register: int):
+        # Protocol bit address of bit 0 of the register, None above the 65536 bit address space
+        if register >= BIT_REGISTERS:
+            return None
+        self.values.add(register)
+        return register * 16
+
+    def Unmap(self, register: int):
+        self.values.discard(register)
+
+    def Clear(self):
+        self.values = set()
+
+    def reset(self):
+        for register in self.values:
+            self.bank.SetRegister(register, 0)
+
+    def validate(self, address: int, count: int = 1):
+        start = address - self.address
+        if count < 1 or start < 0:
+            return False
+        return all(register in self.values for register in range(start >> 4, ((start + count - 1) >> 4) + 1))
+
+    def getValues(self, address: int, count: int = 1):
+        start = address - self.address
+        first = start >> 4
+        last = (start + count - 1) >> 4
+        words = np.array([self.bank.GetRegister(register) for register in range(first, last + 1)], dtype=np.uint16)
+        bits = ((words[:, None] >> np.arange(16, dtype=np.uint16)) & 1).ravel()
+        offset = start - first * 16
+        return bits[offset:offset + count].astype(bool).tolist()
+
+    def setValues(self, address: int, values):
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        start = address - self.address
+        masks = {}
+        for i, bit in enumerate(values):
+            register = (start + i) >> 4
+            setMask, clearMask = masks.get(register, (0, 0))
+            if bit:
+                setMask |= 1 << ((start + i) & 15)
+            else:
+                clearMask |= 1 << ((start + i) & 15)
+            masks[register] = (setMask, clearMask)
+        for register, (setMask, clearMask) in masks.items():
+            self.bank.SetRegister(register, (self.bank.GetRegister(register) & ~clearMask) | setMask)
+            self.bank.Notify(register, 1)
+
+class SimDeviceContext(ModbusDeviceContext):
+    # Answer requests touching unmapped registers with Modbus exceptions instead of zeros
+    def Valid(self, fc_as_hex, address, count=1):
+        block = self.store[self.decode(fc_as_hex)]
+        return not hasattr(block, 'validate') or block.validate(address + CONTEXT_OFFSET, count)
+
+    def getValues(self, fc_as_hex, address, count=1):
+        #Read requests are checked by the PDUs below first, this only guards other callers
+        if not self.Valid(fc_as_hex, address, count):
+            raise ParameterException(f"Illegal data address {address} (count {count})")
+        return super().getValues(fc_as_hex, address, count)
+
+    def setValues(self, fc_as_hex, address, values):
+        if not self.Valid(fc_as_hex, address, len(values)):
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        return super().setValues(fc_as_hex, address, values)
+
+class CheckedRead:
+    # pymodbus read requests ignore datastore errors and turn exceptions into DEVICE_FAILURE with a logged
+    # traceback. Check the read span first and answer ILLEGAL_ADDRESS like the write path does
+    def ReadSpan(self):
+        return self.address, self.count
+
+    async def update_datastore(self, context):
+        address, count = self.ReadSpan()
+        if hasattr(context, 'Valid') and not context.Valid(self.function_code, address, count):
+            return ExceptionResponse(self.function_code, ExceptionResponse.ILLEGAL_ADDRESS)
+        return await super().update_datastore(context)
+
+class SimReadCoilsRequest(CheckedRead, ReadCoilsRequest):
+    pass
+
+class SimReadDiscreteInputsRequest(CheckedRead, ReadDiscreteInputsRequest):
+    pass
+
+class SimReadHoldingRegistersRequest(CheckedRead, ReadHoldingRegistersRequest):
+    pass
+
+class SimReadInputRegistersRequest(CheckedRead, ReadInputRegistersRequest):
+    pass
+
+class SimReadWriteMultipleRegistersRequest(CheckedRead, ReadWriteMultipleRegistersRequest):
+    #Checked before the write half runs, a request with an unmapped read span changes nothing
+    def ReadSpan(self):
+        return self.read_address, self.read_count
+
+class SimMaskWriteRegisterRequest(CheckedRead, MaskWriteRegisterRequest):
+    def ReadSpan(self):
+        return self.address, 1
+
+#Passed to the server as custom_pdu, replacing the stock request classes of the same function codes
+CHECKED_REQUESTS = [SimReadCoilsRequest, SimReadDiscreteInputsRequest, SimReadHoldingRegistersRequest,
+                    SimReadInputRegistersRequest, SimReadWriteMultipleRegistersRequest, SimMaskWriteRegisterRequest]
+
+class RegisterImage:
+    # Local copy of a device's register span, written back to the bank in one call
+    def __init__(self, bank, address: int, count: int):
+        self.bank = bank
+        self.address = address
+        self.count = count
+        self.values = None
+        self.dirty = None
+        #Register traffic of the device, the profiler counts the share of its simulation passes and jobs
+        self.Reads = 0
+        self.Writes = 0
+
+    def Snapshot(self):
+        if self.values is None:
+            self.values = self.bank.GetRegisters(self.address, self.count).copy()
+            self.dirty = np.zeros(self.count, dtype=bool)
+
+    def Commit(self):
+        if self.values is not None:
+            if self.dirty.any():
+                self.bank.SetMasked(self.address, self.values, self.dirty)
+            self.values = None
+            self.dirty = None
+
+    @property
+    def Sequence(self):
+        return self.bank.Sequence
+
+    def AddWriteHook(self, address: int, callback):
+        self.bank.AddWriteHook(address, callback)
+
+    def RemoveWriteHook(self, address: int):
+        self.bank.RemoveWriteHook(address)
+
+    def ChangedSince(self, sequence: int):
+        return self.bank.Changed(self.address, self.count, sequence)
+
+    def GetRegister(self, address: int):
+        self.Reads += 1
+        offset = address - self.address
+        if self.values is not None and 0 <= offset < self.count:
+            return int(self.values[offset])
+        return self.bank.GetRegister(address)
+
+    def SetRegister(self, address: int, value: int):
+        self.Writes += 1
+        offset = address - self.address
+        if self.values is not None and 0 <= offset < self.count:
+            value &= 0xFFFF
+            if self.values[offset] != value:
+                self.values[offset] = value
+                self.dirty[offset] = True
+        else:
+            self.bank.SetRegister(address, value)
@@ -0,0 +1,44 @@
+import numpy as np
+
+#Registers taken by each tag codec
+WIDTHS = {'int': 1, 'Sint': 1, 'long': 2, 'longInv': 2, 'float': 2, 'floatInv': 2}
+VECTORS = (('Status01', 0), ('Status02', 1), ('Control01', 2))
+TAGS_START = 3
+
+
+class TypeLayout:
+    # Register layout of a device type, computed once per type from devices.json: the offset of every
+    # vector and tag from the device start address, with its codec and decimal points
+    def __init__(self, definition: dict):
+        self.Registers = definition['Registers']
+        self.Vectors = [(name, offset) for name, offset in VECTORS if definition[name]]
+        offset = TAGS_START
+        self.Analog = []
+        self.Settings = []
+        for group, tags in (('Analog', self.Analog), ('Settings', self.Settings)):
+            for tag in definition[group] or []:
+                if tag['type'] in WIDTHS:
+                    tags.append((offset, tag['type'], tag.get('dp', 0)))
+                    offset += WIDTHS[tag['type']]
+
+    def Encode(self, group: str, values):
+        # Register words of a (devices x tags) value matrix, returned as offsets and a (devices x words) matrix
+        tags = getattr(self, group)
+        values = np.asarray(values, dtype=np.float64)[:, :len(tags)]
+        offsets = []
+        words = []
+        for column, (offset, codec, decimalPoints) in enumerate(tags):
+            value = values[:, column]
+            if codec in ('int', 'Sint'):
+                offsets.append(offset)
+                words.append(np.rint(value * 10**decimalPoints).astype(np.int64) & 0xFFFF)
+                continue
+            if codec in ('long', 'longInv'):
+                value = value.astype(np.int64) & 0xFFFFFFFF
+            else:
+                value = value.astype(np.float32).view(np.uint32).astype(np.int64)
+            low, high = value & 0xFFFF, value >> 16
+            offsets += [offset, offset + 1]
+            words += [high, low] if codec.endswith('Inv') else [low, high]
+        return np.array(offsets, dtype=np.int64), np.stack(words, axis=1) if words else np.zeros((len(values), 0), dtype=np.int64)
+
@@ -0,0 +1,143 @@
+import hashlib
+import numpy as np
+
+GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MASK64 = (1 << 64) - 1
+
+
+def SplitMix(x):
+    # SplitMix64 finaliser, works on Python ints and on uint64 arrays
+    if isinstance(x, int):
+        x = (x + 0x9E3779B97F4A7C15) & MASK64
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+        return x ^ (x >> 31)
+    x = x + GAMMA
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def StreamKey(seed: int, key: str):
+    # Stable 64 bit key of a named substream, independent of creation order
+    digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+    return SplitMix((seed ^ digest) & MASK64)
+
+
+class NoiseStage:
+    # Plant wide noise: reference values and amplitudes of every noisy tag live in arrays,
+    # one batch of noise is encoded to registers and written per bank in a single pass.
+    # Each tag draws from its own counter based substream, so runs with the same seed replay exactly
+    def __init__(self, seed: int = 0, capacity: int = 256):
+        self.Seed = seed
+        self.banks = []
+        self.size = 0
+        self.free = []
+        self.layout = None
+        self.bank = np.zeros(capacity, dtype=np.int32)
+        self.address = np.zeros(capacity, dtype=np.int64)
+        self.words = np.zeros(capacity, dtype=np.int8)
+        self.isFloat = np.zeros(capacity, dtype=bool)
+        self.inverse = np.zeros(capacity, dtype=bool)
+        self.scale = np.ones(capacity, dtype=np.float64)
+        self.base = np.zeros(capacity, dtype=np.float64)
+        self.amplitude = np.zeros(capacity, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.key = np.zeros(capacity, dtype=np.uint64)
+        self.counter = np.zeros(capacity, dtype=np.uint64)
+
+    def Grow(self):
+        for name in ('bank', 'address', 'words', 'isFloat', 'inverse', 'scale', 'base', 'amplitude', 'active', 'key', 'counter'):
+            array = getattr(self, name)
+            grown = np.zeros(len(array) * 2, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def Add(self, bank, tag, base: float, amplitude: float, active: bool = True, key: str = ''):
+        if self.free:
+            channel = self.free.pop()
+        else:
+            if self.size == len(self.active):
+                self.Grow()
+            channel = self.size
+            self.size += 1
+        if bank not in self.banks:
+            self.banks.append(bank)
+        self.bank[channel] = self.banks.index(bank)
+        self.address[channel] = tag.Address
+        if tag.Codec in ('long', 'float'):
+            self.words[channel] = 2
+            self.isFloat[channel] = tag.Codec == 'float'
+            self.inverse[channel] = tag.inverse
+            self.scale[channel] = 1
+        else:
+            self.words[channel] = 1
+            self.isFloat[channel] = False
+            self.inverse[channel] = False
+            self.scale[channel] = 10**tag.decimalPoints
+        self.base[channel] = base
+        self.amplitude[channel] = amplitude
+        self.active[channel] = active
+        self.key[channel] = StreamKey(self.Seed, key)
+        self.counter[channel] = 0
+        self.layout = None
+        return channel
+
+    def Remove(self, channel: int):
+        self.active[channel] = False
+        self.free.append(channel)
+        self.layout = None
+
+    def Set(self, channel: int, base: float = None, amplitude: float = None):
+        if base is not None:
+            self.base[channel] = base
+        if amplitude is not None:
+            self.amplitude[channel] = amplitude
+
+    def Enable(self, channels, active: bool):
+        if (self.active[channels] != active).any():
+            self.active[channels] = active
+            self.layout = None
+
+    def Build(self):
+        # Word addresses sorted per bank, rebuilt only when the set of active channels changes
+        channels = np.flatnonzero(self.active[:self.size])
+        single = channels[self.words[channels] == 1]
+        double = channels[self.words[channels] == 2]
+        inverse = self.inverse[double].astype(np.int64)
+        addresses = np.concatenate([self.address[single], self.address[double] + inverse, self.address[double] + 1 - inverse])
+        banks = np.concatenate([self.bank[single], self.bank[double], self.bank[double]])
+        order = np.lexsort((addresses, banks))
+        addresses = addresses[order]
+        banks = banks[order]
+        bounds = np.flatnonzero(banks[1:] != banks[:-1]) + 1
+        segments = [(self.banks[banks[start]], start, stop) for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(banks)]) if stop > start]
+        self.layout = (single, double, order, addresses, segments)
+
+    def Update(self):
+        if self.layout is None:
+            self.Build()
+        single, double, order, addresses, segments = self.layout
+        if not len(order):
+            return
+        noise = self.Draw(np.concatenate([single, double]))
+        value = self.base[single] + self.amplitude[single] * noise[:len(single)]
+        words = np.rint(value * self.scale[single]).astype(np.int64)
+        value = self.base[double] + self.amplitude[double] * noise[len(single):]
+        isFloat = self.isFloat[double]
+        raw = np.empty(len(double), dtype=np.int64)
+        raw[isFloat] = value[isFloat].astype(np.float32).view(np.uint32)
+        raw[~isFloat] = np.rint(value[~isFloat]).astype(np.int64) & 0xFFFFFFFF
+        words = (np.concatenate([words, raw & 0xFFFF, raw >> 16])[order] & 0xFFFF).astype(np.uint16)
+        for bank, start, stop in segments:
+            bank.Scatter(addresses[start:stop], words[start:stop])
+
+    def Draw(self, channels):
+        # Uniform noise in [-1, 1) from each channel's key and draw counter
+        counter = self.counter[channels]
+        bits = SplitMix(self.key[channels] + counter * GAMMA)
+        self.counter[channels] = counter + np.uint64(1)
+        return (bits >> np.uint64(11)) * (2.0 / (1 << 53)) - 1.0
+
+    def __len__(self):
+        return int(self.active[:self.size].sum())
@@ -1,83 +1,314 @@
 import sys
 import subprocess
-from PySide6.QtWidgets import QApplication, QMainWindow,QDialog,QTreeWidgetItem,QTableWidgetItem,QMessageBox,QListWidgetItem,QInputDialog,QLineEdit
-from PySide6.QtCore import QThread, Signal, Slot, Qt
+from PySide6.QtWidgets import QApplication, QMainWindow,QDialog,QTreeWidgetItem,QTableWidgetItem,QMessageBox,QListWidgetItem,QInputDialog,QLineEdit,QMenu,QVBoxLayout,QHBoxLayout,QComboBox,QPushButton,QTableWidget
+from PySide6.QtCore import QThread, Signal, Slot, Qt, QTimer
 from PySide6.QtGui import QBrush, QColor
-from pymodbus.server import StartTcpServer, ServerStop
-from pymodbus.datastore import ModbusSequentialDataBlock, ModbusDeviceContext, ModbusServerContext
+from pymodbus.server import StartAsyncTcpServer
+from pymodbus.datastore import ModbusServerContext
 from UI import Ui_MainWindow
 from ConfigDialog import Ui_ConfigDialog
 import threading
+import queue
 import socket
 import os
 import json
 import jsbeautifier
 import math
 import numpy as np
-from time import sleep
+from time import sleep, perf_counter, monotonic
 import asyncio
 import random
+import hashlib
+from datetime import datetime
 from pympler import asizeof
 from SimObjects import *
+from Scheduler import Scheduler, SimClock, TickMonitor
+from Noise import NoiseStage
+from Behaviour import BehaviourTable
+from Registry import Registry
+from Workers import WorkerPool
+from ProcessModel import TankModel
+from Layout import TypeLayout, WIDTHS
+from RegisterMap import RegisterMap, CODECS
+from Reload import PlantDiff
+from Allocator import AddressAllocator, UnitOf
+from Profiler import SimProfiler
+from DataStore import RegisterBank, PagedRegisterBank, RegisterBitBlock, RegisterImage, SimDeviceContext, CONTEXT_OFFSET, CHECKED_REQUESTS
 
 
 
-# Initialize your data store
-store = ModbusDeviceContext(hr=ModbusSequentialDataBlock(0, [0]*50000))
-context = ModbusServerContext(devices=store, single=True)
 
+NOISE_INTERVAL = 2
+NOISE_SLOWDOWN = 8
+OVERRUN_LIMIT = 0.25
 
-class ServerThread:
+
+class SimEngine:
+    # Hosts the Modbus server and the simulation pass on one event loop in one thread
     def __init__(self):
-        self.server_process = None
+        self.engine_thread = None
         self._is_running = False
-        self.server_task = None
+        self.main_task = None
         self.loop = None
+        self.context = None
+        self.commands = queue.SimpleQueue()
+        self.command_event = None
+        #Set when the Modbus server could not start, the simulation keeps running without it
+        self.serverError = None
+        self.simulatorList = []
+        self.profiler = SimProfiler()
+        self.ticks = TickMonitor()
+        #Adaptive engines refresh noise less often while ticks overrun, command handling keeps the full rate
+        self.adaptive = False
+        #Worker processes simulating a share of the places, None simulates everything on this loop
+        self.workers = None
+        self.clock = SimClock()
+        self.scheduler = Scheduler(self.clock)
+        #Noisy analog tags of all simulated devices are updated together
+        self.noise = NoiseStage()
+        self.noiseJob = self.scheduler.Every(NOISE_INTERVAL, self.noise.Update)
+        #Tank levels integrate the flows of the pumps and valves linked to them
+        self.tanks = TankModel(self.clock)
+        self.scheduler.Every(1, self.tanks.Update)
     
     @property
     def is_running(self):
         return self._is_running
 
-    def start_server(self):
+    def start(self, context):
         if not self.is_running:
-            self.server_process = threading.Thread(target=self.run_server)
-            self.server_process.daemon = True
-            self.server_process.start()
+            self.context = context
+            self.loop = asyncio.new_event_loop()
+            self.engine_thread = threading.Thread(target=self.run)
+            self.engine_thread.daemon = True
+            self.engine_thread.start()
             self._is_running = True
         
-    def stop_server(self):
-        if self.server_process is not None:
+    def stop(self):
+        if self.engine_thread is not None:
             try:
-                if self.loop and self.server_task:
-                    self.loop.call_soon_threadsafe(self.server_task.cancel)
-                if self.loop:
-                    self.loop.call_soon_threadsafe(self.loop.stop)
-            except:
+                if self.loop and self.main_task:
+                    self.loop.call_soon_threadsafe(self.main_task.cancel)
+            except RuntimeError:
                 pass
-            self.server_process.join(timeout=1)  # Wait for the process to terminate
-            self.server_process = None
+            self.engine_thread.join(timeout=1)
+            self.engine_thread = None
             self._is_running = False
+        if self.workers:
+            self.workers.Stop()
+            self.workers = None
+            
+    def post(self, function, *args):
+        #Thread safe entry point for the UI, commands run on the engine loop, directly while the engine is stopped
+        if not self.is_running:
+            function(*args)
+            return
+        self.commands.put((function, args))
+        if self.loop and self.command_event:
+            try:
+                self.loop.call_soon_threadsafe(self.command_event.set)
+            except RuntimeError:
+                #The loop closed meanwhile
+                pass
+            
+    def call(self, function, *args):
+        #Runs a command on the engine loop and waits for its result, directly while the engine is stopped
+        if not self.is_running:
+            return function(*args)
+        done = threading.Event()
+        result = {}
+        def command():
+            try:
+                result['value'] = function(*args)
+            except Exception as e:
+                result['error'] = e
+            finally:
+                done.set()
+        self.post(command)
+        if not self.is_running and not done.is_set():
+            raise RuntimeError("Engine stopped before running the command")
+        if not done.wait(timeout=10):
+            raise TimeoutError("Engine did not run the command")
+        if 'error' in result:
+            raise result['error']
+        return result['value']
             
-    def run_server(self):
-        # Create a new event loop for this thread
-        self.loop = asyncio.new_event_loop()
+    def run(self):
         asyncio.set_event_loop(self.loop)
-        
         try:
-            # Start the TCP server - in pymodbus 3.x this is synchronous
-            StartTcpServer(context=context, address=("", 502))
+            self.main_task = self.loop.create_task(self.main())
+            self.loop.run_until_complete(self.main_task)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            print(f"Server error: {e}")
+            print(f"Engine error: {e}")
         finally:
-            if self.loop and not self.loop.is_closed():
-                self.loop.close()
+            self._is_running = False
+            self.loop.close()
+            
+    async def main(self):
+        self.command_event = asyncio.Event()
+        await asyncio.gather(self.serve(), self.process_commands(), self.simulate_objects())
+
+    async def serve(self):
+        #A port that is busy or needs privileges stops only the server, not the simulation
+        try:
+            await StartAsyncTcpServer(context=self.context, address=("", 502), custom_pdu=CHECKED_REQUESTS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.serverError = e
+            print(f"Modbus server error: {e}")
+        
+    async def process_commands(self):
+        while True:
+            while not self.commands.empty():
+                function, args = self.commands.get()
+                try:
+                    function(*args)
+                except Exception as e:
+                    print(f"Command error: {e}")
+            await self.command_event.wait()
+            self.command_event.clear()
+            
+    async def simulate_objects(self):
+        #Fixed rate ticks, each measured against its deadline. Late ticks are counted and the missed
+        #ticks dropped instead of run back to back
+        deadline = monotonic()
+        while True:
+            start = monotonic()
+            self.step()
+            now = monotonic()
+            period = self.clock.TickDelay
+            deadline += period
+            self.ticks.Record(now - start, period > 0 and now > deadline)
+            if self.adaptive:
+                self.adapt()
+            if deadline < now:
+                deadline = now
+            #Stepped clocks still yield so the server and commands keep running
+            await asyncio.sleep(deadline - now)
+
+    def adapt(self):
+        load = self.ticks.Load
+        if load is None:
+            return
+        if load > OVERRUN_LIMIT and self.noiseJob.interval < NOISE_INTERVAL * NOISE_SLOWDOWN:
+            self.noiseJob.interval *= 2
+            self.ticks.Settle()
+        elif load == 0 and self.noiseJob.interval > NOISE_INTERVAL:
+            self.noiseJob.interval //= 2
+            self.ticks.Settle()
+
+    def step(self):
+        #One pass per tick: due timer jobs first, then objects whose registers changed
+        self.clock.Advance()
+        self.scheduler.RunDue()
+        for object in self.simulatorList:
+            try:
+                object.Simulate()
+            except Exception as e:
+                print(f"Error of Object: {e}")
+                object.Profile.Error(e)
+            
+    def is_remote(self, device):
+        return self.workers is not None and self.workers.Owner(device) is not None
+
+    def wake_simulator(self, device):
+        #UI writes skip the server's write hooks, so worker owned devices are told directly
+        if self.is_remote(device):
+            self.workers.Wake(device)
+
+    def set_sim_scale(self, device, simScale):
+        device.SimScale = simScale
+        if self.is_remote(device):
+            self.workers.Scale(device)
+        elif device.Simulator is not None:
+            device.Simulator.SetScale(simScale)
+
+    def write_device(self, device, writes):
+        #UI writes as (tag, value) pairs, posted so they never land between a simulator's Snapshot and Commit
+        for tag, value in writes:
+            if tag.Value != value:
+                tag.Value = value
+        self.wake_simulator(device)
+            
+    def add_simulator(self, device):
+        if self.is_remote(device):
+            self.workers.Add(device)
+        elif device.Simulator is None:
+            device.AddSimulator(self.scheduler, self.noise)
+            device.Simulator.SetProfile(self.profiler.Record(device))
+            self.simulatorList.append(device.Simulator)
+            if device.Inflows:
+                self.tanks.Add(device)
+            
+    def add_simulators(self, devices):
+        for device in devices:
+            self.add_simulator(device)
+
+    def stats(self):
+        #Per device profile of this process and of the worker processes
+        stats = self.profiler.Stats()
+        if self.workers:
+            stats += self.workers.Stats()
+        return stats
+
+    def reload_plant(self, plant, plan, placesDecl, definitions, registerMap):
+        #Runs between two ticks and two server requests. Only devices of the plan stop, the moved and
+        #replaced ones simulate again on their new objects. Their jobs do not carry over, so transitions
+        #in progress are settled first and no status is left half way, a valve stuck "opening"
+        restart = []
+        for key in plan.Stopped():
+            device = plant.LoadedDevice(key)
+            if device and device.Simulator and key not in plan.Removed:
+                device.Simulator.Settle()
+                restart.append(key)
+        moved = plant.MovedRegisters(plan)
+        for key in plan.Stopped():
+            device = plant.LoadedDevice(key)
+            if device and device.Simulator:
+                self.remove_simulator(device)
+        plant.Reload(plan, placesDecl, definitions, registerMap, moved)
+        #Updated devices keep their simulators, a new simscale reaches them like a change in the UI
+        for key in plan.Updated:
+            device = plant.LoadedDevice(key)
+            place, name = key.split('/', 1)
+            if device and device.SimScale != placesDecl[place][name]['simscale']:
+                self.set_sim_scale(device, placesDecl[place][name]['simscale'])
+        devices = [plant.GetDevice(key) for key in restart]
+        devices = [device for device in devices if device.EnableSimulate]
+        self.add_simulators(devices)
+        #Flow links are rebuilt for every created place, tanks follow their current inflows
+        for simulator in self.simulatorList:
+            if simulator.device.Inflows:
+                self.tanks.Add(simulator.device)
+            else:
+                self.tanks.Remove(simulator.device)
+        self.tanks.Invalidate()
+        return devices
+
+    def remove_simulators(self, devices):
+        for device in devices:
+            self.remove_simulator(device)
+            
+    def remove_simulator(self, device):
+        if self.is_remote(device):
+            self.workers.Remove(device)
+        elif device.Simulator:
+            self.tanks.Remove(device)
+            self.simulatorList.remove(device.Simulator)
+            device.RemoveSimulator()
         
 
 class Register:
-    def __init__(self, address:int, value:int):
+    def __init__(self, bank, address:int, value:int):
+        self.bank = bank
         self.addr = address
         self.val = value
-        store.setValues(3, self.addr, [self.val])
+        #Registers of a plant start without a write, their initial values go in with the plant's bulk write
+        if value is not None:
+            self.bank.SetRegister(self.addr, self.val)
     
     @property
     def Address(self):
@@ -89,23 +320,18 @@ class Register:
         
     @property
     def Value(self):
-        result = store.getValues(3, self.addr, count=1)
-        if isinstance(result, list) or isinstance(result, tuple):
-            self.val = result[0]
-        else:
-            # If result is an exception code, handle gracefully
-            self.val = 0
+        self.val = self.bank.GetRegister(self.addr)
         return self.val
     
     @Value.setter
     def Value(self, value:int):
         self.val = value
-        store.setValues(3, self.addr, [self.val])
+        self.bank.SetRegister(self.addr, self.val)
 
 
 class Vector:
-    def __init__(self,address:int, value:int):
-        self.register = Register(address, value)
+    def __init__(self, bank, address:int, value:int):
+        self.register = Register(bank, address, value)
 
     def SetBit(self, position: int, status: int):
         if status:
@@ -151,9 +377,11 @@ class Vector:
         self.register.Address = address
 
 class IntTag:
-    def __init__(self, address:int, value:float, decimalPoints:int):
+    Codec = 'int'
+
+    def __init__(self, bank, address:int, value:float, decimalPoints:int):
         self.decimalPoints = decimalPoints
-        self.register = Register(address, int(round(value*10**self.decimalPoints)))
+        self.register = Register(bank, address, None if value is None else int(round(value*10**self.decimalPoints)))
     
     def SetDecimalPoints(self, decimalPoints:int):
         value = self.Value
@@ -177,9 +405,11 @@ class IntTag:
         self.register.Address = address
 
 class SignedIntTag:
-    def __init__(self, address:int, value:float, decimalPoints:int):
+    Codec = 'Sint'
+
+    def __init__(self, bank, address:int, value:float, decimalPoints:int):
         self.decimalPoints = decimalPoints
-        self.register = Register(address, int(round(value*10**self.decimalPoints)))
+        self.register = Register(bank, address, None if value is None else int(round(value*10**self.decimalPoints)))
     
     def SetDecimalPoints(self, decimalPoints:int):
         value = self.Value
@@ -206,11 +436,14 @@ class SignedIntTag:
         self.register.Address = address
 
 class LongTag:
-    def __init__(self, address:int, value:int, inverse:bool=False):
+    Codec = 'long'
+
+    def __init__(self, bank, address:int, value:int, inverse:bool=False):
         self.inverse = inverse
-        self.register1 = Register(address, 0)
-        self.register2 = Register(address+1, 0)
-        self.Value = value
+        self.register1 = Register(bank, address, None)
+        self.register2 = Register(bank, address+1, None)
+        if value is not None:
+            self.Value = value
     
     @property
     def Value(self):
@@ -244,11 +477,14 @@ class LongTag:
         
         
 class FloatTag:
-    def __init__(self, address:int, value:float,inverse:bool=False):
+    Codec = 'float'
+
+    def __init__(self, bank, address:int, value:float,inverse:bool=False):
         self.inverse = inverse
-        self.register1 = Register(address, 0)
-        self.register2 = Register(address+1, 0)
-        self.Value = value
+        self.register1 = Register(bank, address, None)
+        self.register2 = Register(bank, address+1, None)
+        if value is not None:
+            self.Value = value
     
     @property
     def Value(self):
@@ -282,76 +518,69 @@ class FloatTag:
         self.Value = float(value)
 
         
+TAG_CLASSES = {
+    'int': lambda bank, address, decimalPoints: IntTag(bank, address, None, decimalPoints),
+    'Sint': lambda bank, address, decimalPoints: SignedIntTag(bank, address, None, decimalPoints),
+    'long': lambda bank, address, decimalPoints: LongTag(bank, address, None),
+    'longInv': lambda bank, address, decimalPoints: LongTag(bank, address, None, True),
+    'float': lambda bank, address, decimalPoints: FloatTag(bank, address, None),
+    'floatInv': lambda bank, address, decimalPoints: FloatTag(bank, address, None, True),
+}
+
+
 class Device:
-    def __init__(self,deviceDecl:dict,definitions:dict):
+    def __init__(self,deviceDecl:dict,definitions:dict,bank,key:str='',preload:bool=True,layout:TypeLayout=None,tags=None):
         #Basic Parameters
+        self.Key = key
         self.Name = deviceDecl['name']
         self.StartAddress = deviceDecl['address']
         self.Type = deviceDecl['type']
         self.ParentKey = deviceDecl['parent']
         self.EnableSimulate = definitions[self.Type]['EnableSimulate']
+        self.Registers = definitions[self.Type]['Registers']
+        self.Image = RegisterImage(bank, self.StartAddress, self.Registers)
         #Control Parameters
         self.Status01 = None
         self.Status02 = None
         self.Control01 = None
+        self.CoilAddress = {}
+        self.InputAddress = {}
         self.Analog = []
         self.Settings = []
         #Simulation Parameters
         self.Simulate = False
         self.SimScale = deviceDecl['simscale']
         self.Simulator = None
+        self.Behaviour = None
+        self.Inflows = []
         self.SettingsLoad = True
         self.AnalogLoad = False
         self.StatusLoad = False
         #Create Device
-        self.CreateDevice(deviceDecl,definitions)
-        self.Preload(deviceDecl)
+        self.Layout = layout or TypeLayout(definitions[self.Type])
+        if tags is None:
+            self.CreateDevice(deviceDecl,definitions)
+        else:
+            self.CreateFromMap(tags)
+        if preload:
+            self.Preload(deviceDecl)
         
     def CreateDevice(self,deviceDecl:dict,definitions:dict):
-        counter = 3  
-        if definitions[self.Type]['Status01']:
-            self.Status01 = Vector(self.StartAddress,0)
-        if definitions[self.Type]['Status02']:
-            self.Status02 = Vector(self.StartAddress+1,0)    
-        if definitions[self.Type]['Control01']:
-            self.Control01 = Vector(self.StartAddress+2,0)
-        if definitions[self.Type]['Analog']:
-            for analogTag in definitions[self.Type]['Analog']:
-                if analogTag['type'] == 'int':
-                    self.Analog.append(IntTag(self.StartAddress + counter,0,analogTag['dp']))
-                    counter += 1
-                elif analogTag['type'] == 'Sint':
-                    self.Analog.append(SignedIntTag(self.StartAddress + counter,0,analogTag['dp']))
-                    counter += 1
-                elif analogTag['type'] == 'long':
-                    self.Analog.append(LongTag(self.StartAddress + counter,0))
-                    counter += 2
-                elif analogTag['type'] == 'float':
-                    self.Analog.append(FloatTag(self.StartAddress + counter,0))
-                    counter += 2
-                elif analogTag['type'] == 'longInv':
-                    self.Analog.append(LongTag(self.StartAddress + counter,0,True))
-                    counter += 2
-                elif analogTag['type'] == 'floatInv':
-                    self.Analog.append(FloatTag(self.StartAddress + counter,0,True))
-                    counter += 2
-        if definitions[self.Type]['Settings']:
-            for settingTag in definitions[self.Type]['Settings']:
-                if settingTag['type'] == 'int':
-                    self.Settings.append(IntTag(self.StartAddress + counter,0,settingTag['dp']))
-                    counter += 1
-                elif settingTag['type'] == 'long':
-                    self.Settings.append(LongTag(self.StartAddress + counter,0))
-                    counter += 2
-                elif settingTag['type'] == 'float':
-                    self.Settings.append(FloatTag(self.StartAddress + counter,0))
-                    counter += 2
-                elif settingTag['type'] == 'longInv':
-                    self.Settings.append(LongTag(self.StartAddress + counter,0,True))
-                    counter += 2
-                elif settingTag['type'] == 'floatInv':
-                    self.Settings.append(FloatTag(self.StartAddress + counter,0,True))
-                    counter += 2
+        #Tags are placed from the type layout without writing, a new bank already reads zero
+        for vector, offset in self.Layout.Vectors:
+            setattr(self, vector, Vector(self.Image,self.StartAddress+offset,None))
+        for offset, codec, decimalPoints in self.Layout.Analog:
+            self.Analog.append(TAG_CLASSES[codec](self.Image,self.StartAddress+offset,decimalPoints))
+        for offset, codec, decimalPoints in self.Layout.Settings:
+            self.Settings.append(TAG_CLASSES[codec](self.Image,self.StartAddress+offset,decimalPoints))
+
+    def CreateFromMap(self,tags):
+        #Tag rows of the compiled register map: vectors, analog and settings in layout order, with absolute addresses
+        for address, width, codec, decimalPoints, device, group, tag in tags.tolist():
+            if group == 0:
+                setattr(self, self.Layout.Vectors[tag][0], Vector(self.Image,address,None))
+            else:
+                (self.Analog if group == 1 else self.Settings).append(TAG_CLASSES[CODECS[codec]](self.Image,address,decimalPoints))
                     
     def Preload(self,deviceDecl:dict):
         if self.SettingsLoad:
@@ -377,10 +606,23 @@ class Device:
         if self.Status02 and deviceDecl['status02']:
             self.Status02.Value = deviceDecl['status02']
                     
-    def AddSimulator(self):
+    def Snapshot(self):
+        self.Image.Snapshot()
+
+    def Commit(self):
+        self.Image.Commit()
+
+    @property
+    def Sequence(self):
+        return self.Image.Sequence
+
+    def ChangedSince(self, sequence:int):
+        return self.Image.ChangedSince(sequence)
+
+    def AddSimulator(self, scheduler, noise):
         if self.Simulator is None:
             self.Simulate = True
-            self.Simulator = Simulator(self)
+            self.Simulator = Simulator(self, scheduler, noise)
             return self.Simulator
 
     def RemoveSimulator(self):
@@ -391,18 +633,55 @@ class Device:
         
         
 class Place:
-    def __init__(self,name:str,devicesDecl:dict,definitions:dict):
+    def __init__(self,name:str,devicesDecl:dict,definitions:dict,bank,unit:int=0,key:str='',preload:bool=True,layouts:dict=None,lazy:bool=False,registerMap:RegisterMap=None):
         self.Name = name
-        self.Devices = {}
-        self.AddDevices(devicesDecl,definitions)
+        self.Key = key
+        self.Unit = unit
+        self.devices = None
+        #Called with the place once its devices exist
+        self.OnCreate = None
+        self.source = (devicesDecl,definitions,bank,preload,layouts,registerMap)
+        if not lazy:
+            self.AddDevices(*self.source)
         
-    def AddDevices(self,devicesDecl:dict,definitions:dict):
-        #check if the self.Devices is empty
-        if self.Devices:
-            self.Devices = {}
+    @property
+    def Devices(self):
+        #Lazy places create their devices on first access, their registers are already initialised
+        if self.devices is None:
+            self.AddDevices(*self.source)
+        return self.devices
+
+    @property
+    def Loaded(self):
+        return self.devices is not None
+        
+    def AddDevices(self,devicesDecl:dict,definitions:dict,bank,preload:bool=True,layouts:dict=None,registerMap:RegisterMap=None):
+        self.devices = {}
+        layouts = layouts or {}
         for device in devicesDecl:
-            self.Devices[device] = Device(devicesDecl[device],definitions)
+            self.devices[device] = self.CreateDevice(device,devicesDecl,definitions,bank,preload,layouts,registerMap)
+        if self.OnCreate:
+            self.OnCreate(self)
+
+    def CreateDevice(self,device:str,devicesDecl:dict,definitions:dict,bank,preload:bool,layouts:dict,registerMap:RegisterMap):
+        #Tags come from the compiled register map when there is one, from the type layout otherwise
+        key = f"{self.Key}/{device}"
+        tags = registerMap.DeviceTags(registerMap.Index(key)) if registerMap is not None else None
+        return Device(devicesDecl[device],definitions,bank,key,preload,layouts.get(devicesDecl[device]['type']),tags)
     
+    def Reload(self,devicesDecl:dict,definitions:dict,bank,layouts:dict,renew:list,registerMap:RegisterMap=None):
+        #New declarations, existing devices not in renew are kept, the rest is created in declaration order
+        self.source = (devicesDecl,definitions,bank,False,layouts,registerMap)
+        if self.devices is None:
+            return
+        devices = {}
+        for device in devicesDecl:
+            if device in self.devices and device not in renew:
+                devices[device] = self.devices[device]
+            else:
+                devices[device] = self.CreateDevice(device,devicesDecl,definitions,bank,False,layouts,registerMap)
+        self.devices = devices
+
     def LinkDevices(self,devicesDecl:dict):
         if self.Devices:
             for device in devicesDecl:
@@ -413,15 +692,266 @@ class Place:
             print("Devices are not created !")
     
 class Plant:
-    def __init__(self,placesDecl:dict,definitions:dict):
+    def __init__(self,placesDecl:dict,definitions:dict,unitIDs:dict=None,banks:dict=None,registerMap:RegisterMap=None,lazy:bool=False):
         self.Places = {}
         self.PlacesDecl = placesDecl
-        self.CreatePlant(placesDecl,definitions)
+        self.Definitions = definitions
+        self.UnitIDs = unitIDs or {}
+        self.Lazy = lazy
+        self.Banks = {}
+        self.Coils = {}
+        self.Inputs = {}
+        #Behaviour tables are compiled once per device type and shared by its devices
+        self.Behaviours = {deviceType:BehaviourTable(definition["Behaviour"]) for deviceType, definition in definitions.items() if definition.get("Behaviour")}
+        #Register layouts likewise, devices are placed from them
+        self.Layouts = {deviceType:TypeLayout(definition) for deviceType, definition in definitions.items()}
+        self.RegisterMap = registerMap
+        if banks is None:
+            if self.RegisterMap is None:
+                self.RegisterMap = Plant.CompileMap(placesDecl,definitions,unitIDs)
+            self.CreateBanks()
+            self.MapBits(placesDecl,definitions)
+            self.CreatePlant(placesDecl,definitions,lazy=lazy)
+        else:
+            #Worker processes attach to the shared banks, whose registers already hold the preloaded
+            #values, building devices does not write to them
+            self.Banks = banks
+            for bank in self.Banks.values():
+                bank.Attach()
+            self.MapBits(placesDecl,definitions)
+            self.CreatePlant(placesDecl,definitions,False,lazy)
+        self.Context = self.CreateContext()
+        
+    def GetUnit(self,place:str):
+        return Plant.UnitOf(self.UnitIDs,place)
+
+    @staticmethod
+    def UnitOf(unitIDs:dict,place:str):
+        return UnitOf(unitIDs,place)
         
-    def CreatePlant(self,placesDecl:dict,definitions:dict):
-        counter = 0
+    @staticmethod
+    def CompileMap(placesDecl:dict,definitions:dict,unitIDs:dict=None,key:str=''):
+        units = {place:Plant.UnitOf(unitIDs,place) for place in placesDecl}
+        return RegisterMap.Compile(placesDecl,definitions,units,key)
+        
+    def CreateBanks(self):
+        devices = self.RegisterMap.Devices
+        if not self.UnitIDs:
+            bank = PagedRegisterBank()
+            for address,registers in zip(devices['address'].tolist(),devices['registers'].tolist()):
+                bank.Map(address,registers)
+            self.Banks[0] = bank
+            return
+        for unit,start,count,offset in self.RegisterMap.Units:
+            self.Banks[unit] = RegisterBank(start + CONTEXT_OFFSET, count, False)
+        #Only the device ranges of a unit are served, like the pages of the shared bank
+        for unit,address,registers in zip(devices['unit'].tolist(),devices['address'].tolist(),devices['registers'].tolist()):
+            self.Banks[unit].Map(address,registers)
+        
+    def MapBits(self,placesDecl:dict,definitions:dict):
+        #Expose Status/Control vectors as discrete inputs / coils at register * 16, registers above 4095 have no bit address.
+        #Mapped from the declarations, devices created later pick up their bit addresses
+        for unit,bank in self.Banks.items():
+            if unit in self.Coils:
+                self.Coils[unit].Clear()
+                self.Inputs[unit].Clear()
+            else:
+                self.Coils[unit] = RegisterBitBlock(bank)
+                self.Inputs[unit] = RegisterBitBlock(bank)
+        self.BitAddresses = {}
+        bitVectors = {}
+        for deviceType,definition in definitions.items():
+            vectors = dict(self.Layouts[deviceType].Vectors)
+            coils = [(vector,vectors[vector]) for vector in definition.get('Coils',[]) if vector in vectors]
+            inputs = [(vector,vectors[vector]) for vector in definition.get('DiscreteInputs',[]) if vector in vectors]
+            if coils or inputs:
+                bitVectors[deviceType] = (coils,inputs)
         for place in placesDecl:
-            self.Places[place] = Place(placesDecl[place][place]['name'],placesDecl[place],definitions)
+            unit = self.GetUnit(place)
+            for name,deviceDecl in placesDecl[place].items():
+                if deviceDecl['type'] not in bitVectors:
+                    continue
+                coils,inputs = bitVectors[deviceDecl['type']]
+                coilAddress = {vector:self.Coils[unit].Map(deviceDecl['address'] + offset) for vector,offset in coils}
+                inputAddress = {vector:self.Inputs[unit].Map(deviceDecl['address'] + offset) for vector,offset in inputs}
+                self.BitAddresses[f"{place}/{name}"] = ({vector:bit for vector,bit in coilAddress.items() if bit is not None},
+                                                        {vector:bit for vector,bit in inputAddress.items() if bit is not None})
+        
+    def CreateDeviceContext(self,unit:int):
+        #Input registers mirror the holding registers
+        return SimDeviceContext(hr=self.Banks[unit], ir=self.Banks[unit], co=self.Coils[unit], di=self.Inputs[unit])
+        
+    def CreateContext(self):
+        if not self.UnitIDs:
+            return ModbusServerContext(devices=self.CreateDeviceContext(0), single=True)
+        devices = {unit:self.CreateDeviceContext(unit) for unit in self.Banks}
+        return ModbusServerContext(devices=devices, single=False)
+        
+    def Share(self):
+        for bank in self.Banks.values():
+            bank.Share()
+
+    def Release(self):
+        for bank in self.Banks.values():
+            bank.Release()
+        
+    def CreatePlant(self,placesDecl:dict,definitions:dict,preload:bool=True,lazy:bool=False):
+        if preload:
+            self.Preload()
+        for place in placesDecl:
+            unit = self.GetUnit(place)
+            self.Places[place] = Place(placesDecl[place][place]['name'],placesDecl[place],definitions,self.Banks[unit],unit,place,False,self.Layouts,True,self.RegisterMap)
+            self.Places[place].OnCreate = self.AttachDevices
+            if not lazy:
+                self.Places[place].Devices
+
+    def AttachDevices(self,place:Place):
+        for device in place.Devices.values():
+            device.Behaviour = self.Behaviours.get(device.Type)
+            device.CoilAddress,device.InputAddress = self.BitAddresses.get(device.Key,({},{}))
+        self.LinkFlows(place)
+
+    def GetDevice(self,key:str):
+        place,device = key.split('/',1)
+        return self.Places[place].Devices[device]
+
+    def LoadedDevice(self,key:str):
+        #Device object of a key if it exists, without creating its place
+        place,device = key.split('/',1)
+        if place in self.Places and self.Places[place].Loaded:
+            return self.Places[place].Devices.get(device)
+        return None
+
+    def MovedRegisters(self,plan):
+        #Current values of the devices a plan moves, read before their simulators stop and restore them
+        moved = {}
+        for key in plan.Moved:
+            place,device = key.split('/',1)
+            deviceDecl = self.PlacesDecl[place][device]
+            count = self.Definitions[deviceDecl['type']]['Registers']
+            moved[key] = self.Banks[self.GetUnit(place)].GetRegisters(deviceDecl['address'],count).copy()
+        return moved
+
+    def Reload(self,plan,placesDecl:dict,definitions:dict,registerMap:RegisterMap,moved:dict=None):
+        #Applies a PlantDiff plan in place. Banks, bit blocks and the server context stay, only the devices
+        #of the plan are created again. Simulators of those devices must be stopped by the caller
+        if moved is None:
+            moved = self.MovedRegisters(plan)
+        oldPlaces = self.PlacesDecl
+        oldDefinitions = self.Definitions
+        self.PlacesDecl = placesDecl
+        self.Definitions = definitions
+        self.RegisterMap = registerMap
+        for deviceType in plan.Types:
+            self.Behaviours.pop(deviceType,None)
+            self.Layouts.pop(deviceType,None)
+            if deviceType in definitions:
+                self.Layouts[deviceType] = TypeLayout(definitions[deviceType])
+                if definitions[deviceType].get("Behaviour"):
+                    self.Behaviours[deviceType] = BehaviourTable(definitions[deviceType]["Behaviour"])
+        for key in plan.Stopped():
+            place,device = key.split('/',1)
+            oldDecl = oldPlaces[place][device]
+            bank = self.Banks[self.GetUnit(place)]
+            count = oldDefinitions[oldDecl['type']]['Registers']
+            bank.SetRegisters(oldDecl['address'],np.zeros(count,dtype=np.uint16))
+            bank.Unmap(oldDecl['address'],count)
+        self.ResizeBanks(plan)
+        for key in plan.Created():
+            place,device = key.split('/',1)
+            address,words = registerMap.DeviceImage(key)
+            self.Banks[self.GetUnit(place)].SetRegisters(address,moved.get(key,words))
+        #Place objects follow the new declaration order, lazy places only take the new declarations
+        renew = {}
+        for key in plan.Created():
+            place,device = key.split('/',1)
+            renew.setdefault(place,[]).append(device)
+        places = {}
+        for place in placesDecl:
+            unit = self.GetUnit(place)
+            if place in self.Places:
+                places[place] = self.Places[place]
+                places[place].Name = placesDecl[place][place]['name']
+                places[place].Reload(placesDecl[place],definitions,self.Banks[unit],self.Layouts,renew.get(place,[]),registerMap)
+            else:
+                places[place] = Place(placesDecl[place][place]['name'],placesDecl[place],definitions,self.Banks[unit],unit,place,False,self.Layouts,True,registerMap)
+                places[place].OnCreate = self.AttachDevices
+                if not self.Lazy:
+                    places[place].Devices
+        self.Places = places
+        self.MapBits(placesDecl,definitions)
+        for key in plan.Updated:
+            place,name = key.split('/',1)
+            deviceDecl = placesDecl[place][name]
+            oldDecl = oldPlaces[place][name]
+            device = self.LoadedDevice(key)
+            if device:
+                device.Name = deviceDecl['name']
+                device.ParentKey = deviceDecl['parent']
+                #Changed preloads are applied again where the device preloads them
+                if device.AnalogLoad and deviceDecl['analog'] != oldDecl['analog']:
+                    device.LoadAnalog(deviceDecl)
+                if device.StatusLoad and (deviceDecl['status01'],deviceDecl['status02']) != (oldDecl['status01'],oldDecl['status02']):
+                    device.LoadStatus(deviceDecl)
+            if deviceDecl['settings'] != oldDecl['settings'] and (device is None or device.SettingsLoad):
+                self.PreloadSettings(key,deviceDecl['type'])
+        for place in self.Places.values():
+            if place.Loaded:
+                for device in place.Devices.values():
+                    device.Inflows = []
+                self.AttachDevices(place)
+
+    def PreloadSettings(self,key:str,deviceType:str):
+        #Settings words of one device from the register map image, its other registers keep their values
+        layout = self.Layouts[deviceType]
+        offsets = np.array([offset + word for offset,codec,decimalPoints in layout.Settings for word in range(WIDTHS[codec])],dtype=np.int64)
+        if len(offsets):
+            address,words = self.RegisterMap.DeviceImage(key)
+            self.Banks[self.GetUnit(key.split('/',1)[0])].Scatter(address + offsets,words[offsets])
+
+    def ResizeBanks(self,plan):
+        #Register space for the created devices, unit banks grow in place and new units join the context
+        for key in plan.Created():
+            place,device = key.split('/',1)
+            unit = self.GetUnit(place)
+            address,words = self.RegisterMap.DeviceImage(key)
+            if not self.UnitIDs:
+                self.Banks[0].Map(address,len(words))
+            elif unit in self.Banks:
+                self.Banks[unit].Resize(address + CONTEXT_OFFSET,len(words))
+                self.Banks[unit].Map(address,len(words))
+            else:
+                self.Banks[unit] = RegisterBank(address + CONTEXT_OFFSET,len(words))
+                self.Coils[unit] = RegisterBitBlock(self.Banks[unit])
+                self.Inputs[unit] = RegisterBitBlock(self.Banks[unit])
+                self.Context[unit] = self.CreateDeviceContext(unit)
+
+    def DevicesWhere(self,match,create:bool=True):
+        #Devices whose declaration matches, only the places holding one are created
+        devices = []
+        for placeKey,place in self.Places.items():
+            if create or place.Loaded:
+                names = [name for name,deviceDecl in self.PlacesDecl[placeKey].items() if match(deviceDecl)]
+                if names:
+                    devices += [place.Devices[name] for name in names]
+        return devices
+
+    def Preload(self):
+        #Initial image of the register map, the non zero words of each unit in one Scatter
+        for unit,bank in self.Banks.items():
+            start,words = self.RegisterMap.Image(unit)
+            used = np.flatnonzero(words)
+            bank.Scatter(start + used, words[used])
+            
+    def LinkFlows(self,place:Place):
+        #"flow" links of pumps and valves to the level sensors of the tanks they fill or drain, within a place
+        for device,deviceDecl in self.PlacesDecl[place.Key].items():
+            for flow in deviceDecl.get('flow') or []:
+                actuator = place.Devices[device]
+                spec = self.Definitions[actuator.Type].get('Flow')
+                if spec is None:
+                    raise ValueError(f"{actuator.Type} has no Flow definition in devices.json")
+                place.Devices[flow['tank']].Inflows.append((actuator, flow['rate'], spec))
             
     def LinkDevices(self):
         if self.Places:
@@ -431,52 +961,131 @@ class Plant:
             print("Places are not created !")
  
 class Simulator:
-    def __init__(self, device: Device):
+    def __init__(self, device: Device, scheduler: Scheduler, noise: NoiseStage):
         self.device = device
         self.simObj = None
-        if self.device.Type == 'Motor-VSD':
-            self.simObj = SimObj_MotorVSD(device)
-        elif self.device.Type == 'Motor-Normal':
-            self.simObj = SimObj_MotorNormal(device)
-        elif self.device.Type == 'Valve-MOV':
-            self.simObj = SimObj_ValveMOV(device)
-        elif self.device.Type == 'Valve-Modulating':
-            self.simObj = SimObj_ValveModulating(device)
-        elif self.device.Type == 'Valve-Solenoid':
-            self.simObj = SimObj_ValveSolenoid(device)
-        elif self.device.Type == 'Sensor-Level':
-            self.simObj = SimObj_SensorLevel(device)
-        elif self.device.Type == 'Sensor-Totalizing':
-            self.simObj = SimObj_SensorTotalizing(device)
-        elif self.device.Type == 'Sensor-Analog':
-            self.simObj = SimObj_SensorAnalog(device)
-        elif self.device.Type == 'PID Control':
-            self.simObj = SimObj_PIDControl(device)
-        elif self.device.Type == 'DPA':
-            self.simObj = SimObj_DPA(device)
-        elif self.device.Type == 'GEN Power':
-            self.simObj = SimObj_Generator(device)
-        elif self.device.Type == 'RSF':
-            self.simObj = SimObj_RSF(device)
-        elif self.device.Type == 'UPS Power':
-            self.simObj = SimObj_UPS(device)
-        elif self.device.Type == 'Screen Package':
-            self.simObj = SimObj_ScreenPackage(device)
-        elif self.device.Type == 'Root':
-            self.simObj = SimObj_Root(device)
-        elif self.device.Type == 'Ventilation Fans':
-            self.simObj = SimObj_VentilationFans(device)
+        self.Sequence = -1
+        self.Profile = None
+        simObjClass = Registry.Lookup(self.device.Type)
+        if simObjClass is None and self.device.Behaviour:
+            #Types described only by their devices.json behaviour need no simulation class
+            simObjClass = SimObj
+        if simObjClass:
+            self.simObj = simObjClass(device, scheduler, noise)
+        #React to commands as soon as a client writes Control01
+        if self.simObj and self.device.Control01:
+            self.device.Image.AddWriteHook(self.device.Control01.Address, self.Wake)
+        
+    def SetProfile(self, record):
+        self.Profile = record
+        if self.simObj:
+            #Jobs the object scheduled while it was created count too
+            self.simObj.Profile = record
+            for job in self.simObj.jobs:
+                job.Owner = record
+            record.JobsCreated += len(self.simObj.jobs)
+        
+    def SetScale(self, simScale:float):
+        if self.simObj:
+            self.simObj.SetScale(simScale)
         
-    async def Simulate(self):
+    def Wake(self, address:int):
+        #Runs on the engine loop, inside the server's write request
+        try:
+            self.Simulate(True)
+        except Exception as e:
+            print(f"Error of Object: {e}")
+            if self.Profile:
+                self.Profile.Error(e)
+        
+    def Simulate(self, force:bool=False):
         if self.simObj:
-            await self.simObj.simulate()
+            #Event driven objects only need to run when their registers have changed
+            if not force and getattr(self.simObj,'EventDriven',False) and not self.device.ChangedSince(self.Sequence):
+                return
+            self.Sequence = self.device.Sequence
+            profile = self.Profile
+            mark = profile.Mark() if profile else None
+            start = perf_counter() if profile else 0
+            self.device.Snapshot()
+            try:
+                #Commands act on the edges of Control01 since the previous pass
+                if self.device.Control01:
+                    self.simObj.commands.Decode(self.device.Control01.Value)
+                    self.simObj.Behave(self.device.Behaviour)
+                self.simObj.simulate()
+            finally:
+                self.device.Commit()
+                if profile:
+                    profile.Add(perf_counter() - start, mark)
             
+    def Settle(self):
+        #Pending transitions are completed before the simulator is stopped to be started again
+        if self.simObj:
+            self.device.Snapshot()
+            try:
+                self.simObj.Settle()
+            finally:
+                self.device.Commit()
+
     def Restore(self):
         if self.simObj:
+            if self.device.Control01:
+                self.device.Image.RemoveWriteHook(self.device.Control01.Address)
+            self.simObj.Stop()
             self.simObj.Restore()
             self.simObj = None
                   
    
+class ProfileDialog(QDialog):
+    # Simulation cost per device or per device type, sortable on every column
+    DEVICE_COLUMNS = ("Name", "Type", "Device", "Calls", "Total", "Mean", "P99", "Job Calls", "Job Total", "Jobs Created", "Reads", "Writes", "Errors", "Last Error")
+    TYPE_COLUMNS = ("Type", "Devices", "Calls", "Total", "Mean", "P99", "Job Calls", "Job Total", "Jobs Created", "Reads", "Writes", "Errors")
+    TIMES = ("Total", "Mean", "P99", "Job Total")
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.setWindowTitle("Top Devices")
+        self.resize(1000, 500)
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        self.cmbView = QComboBox()
+        self.cmbView.addItems(["Devices", "Types"])
+        self.btnRefresh = QPushButton("Refresh")
+        controls.addWidget(self.cmbView)
+        controls.addStretch()
+        controls.addWidget(self.btnRefresh)
+        layout.addLayout(controls)
+        self.tblStats = QTableWidget()
+        self.tblStats.setEditTriggers(QTableWidget.NoEditTriggers)# type: ignore
+        layout.addWidget(self.tblStats)
+        self.cmbView.currentIndexChanged.connect(self.refresh)
+        self.btnRefresh.clicked.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self):
+        stats = self.engine.stats()
+        if self.cmbView.currentText() == "Types":
+            rows, columns = SimProfiler.ByType(stats), self.TYPE_COLUMNS
+        else:
+            rows, columns = stats, self.DEVICE_COLUMNS
+        self.tblStats.setSortingEnabled(False)
+        self.tblStats.clear()
+        self.tblStats.setColumnCount(len(columns))
+        self.tblStats.setRowCount(len(rows))
+        self.tblStats.setHorizontalHeaderLabels([f"{column} (ms)" if column in self.TIMES else column for column in columns])
+        for row, values in enumerate(rows):
+            for column, key in enumerate(columns):
+                item = QTableWidgetItem()
+                #Numbers are set as data so that they sort by value
+                item.setData(Qt.DisplayRole, round(values[key]*1000, 3) if key in self.TIMES else values[key])# type: ignore
+                self.tblStats.setItem(row, column, item)
+        self.tblStats.setSortingEnabled(True)
+        self.tblStats.sortItems(columns.index("Total"), Qt.DescendingOrder)# type: ignore
+        self.tblStats.resizeColumnsToContents()
+
+
 class Helper:
     @staticmethod
     def loadJson(filename):
@@ -525,23 +1134,64 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
-        self.server_thread = ServerThread()
+        self.engine = SimEngine()
         self.InitPlant()
 
     def InitVar(self):
-        self.simulatorList = []
+        self.simulatedDevices = set()
+        self.simulationChanged = False
+        self.uiDevice = None
+        self.uiSequence = 0
 
     def showEvent(self, event):
         super().showEvent(event)
-        self.server_thread.start_server()
+        self.engine.start(self.Plant.Context)
         self.ui.lblServStatus.setText("RUNNING")
     
     def on_reload_button_clicked(self):
+        self.save_SimulatedDevices()
+        #Unit changes in project.json and worker processes still need a restart
+        projDef = Helper.loadJson("project.json")
+        if self.engine.workers or projDef.get('UnitIDs') != self.projDef.get('UnitIDs'):
+            self.restart_Application()
+            return
+        started = perf_counter()
+        placesDecl = Helper.loadJson("places.json")
+        definitions = Helper.loadJson("devices.json")
+        plan = PlantDiff(self.Plant.PlacesDecl,self.Plant.Definitions,placesDecl,definitions)
+        if not plan and not plan.Types:
+            print("Reload --- no changes")
+            return
+        self.projDef = projDef
+        self.devicesDef = definitions
+        self.Places = placesDecl
+        self.LoadPlugins()
+        registerMap = self.LoadRegisterMap()
+        stopped = set(plan.Stopped())
+        restarted = self.engine.call(self.engine.reload_plant,self.Plant,plan,placesDecl,definitions,registerMap)
+        self.simulatedDevices = {device for device in self.simulatedDevices if device.Key not in stopped}
+        self.simulatedDevices.update(restarted)
+        self.uiDevice = None
+        #Keep the open place selected if it still exists
+        current = self.ui.cmbPlace.currentData()
+        self.ui.cmbPlace.blockSignals(True)
+        self.init_DevicesCMB()
+        index = self.ui.cmbPlace.findData(current)
+        self.ui.cmbPlace.setCurrentIndex(max(index, 0))
+        self.ui.cmbPlace.blockSignals(False)
+        self.update_DevicesTree()
+        self.ui.lblTotDev.setText(f"{sum(len(devices) for devices in self.Places.values())}")
+        self.ui.lblSimDev.setText(f"{len(self.simulatedDevices)}")
+        print(f"Reload --- {len(plan.Added)} added, {len(plan.Removed)} removed, {len(plan.Moved)} moved, "
+              f"{len(plan.Replaced)} replaced, {len(plan.Updated)} updated in {(perf_counter() - started)*1000:.1f} ms")
+
+    def restart_Application(self):
         QApplication.quit()
         sleep(1)
         subprocess.run([sys.executable, __file__])
 
     def closeEvent(self, event):
+        self.save_SimulatedDevices()
         self.stop_Threads()
         super().closeEvent(event)
         self.ui.lblServStatus.setText("STOPPED")
@@ -550,10 +1200,64 @@ class MainWindow(QMainWindow):
         self.projDef = Helper.loadJson("project.json")
         self.devicesDef = Helper.loadJson("devices.json")
         self.Places = Helper.loadJson("places.json")
-        self.Plant = Plant(self.Places,self.devicesDef)
+        #"LazyDevices" creates the devices of a place only when it is opened, simulated or looked up
+        self.Plant = Plant(self.Places,self.devicesDef,self.projDef.get('UnitIDs'),registerMap=self.LoadRegisterMap(),
+                           lazy=self.projDef.get('LazyDevices',False))
+        #A fixed Seed in project.json replays a recorded run, otherwise every start gets a new one
+        self.Seed = self.projDef.get('Seed')
+        if self.Seed is None:
+            self.Seed = random.getrandbits(63)
+        self.engine.noise.Seed = self.Seed
+        clock = self.projDef.get('Clock', {})
+        self.engine.clock.Configure(clock.get('Mode', 'real'), clock.get('Scale', 1.0), clock.get('Tick', 0.25))
+        self.engine.adaptive = clock.get('Adaptive', False)
+        self.write_RunManifest()
+        self.LoadPlugins()
+        self.StartWorkers()
         #self.Plant.LinkDevices()
         self.InitUi()
             
+    def LoadRegisterMap(self):
+        #Compiled register map of the project files, cached in "registermap" next to project.json
+        dirName = os.path.dirname(__file__)
+        sources = [os.path.join(dirName, filename) for filename in ("project.json", "devices.json", "places.json")]
+        compile = lambda key: Plant.CompileMap(self.Places,self.devicesDef,self.projDef.get('UnitIDs'),key)
+        return RegisterMap.Cached(os.path.join(dirName, "registermap"), sources, compile)
+
+    def LoadPlugins(self):
+        #Site specific simulators live in the "Plugins" folders of project.json or in installed packages,
+        #only the ones for device types used in places.json are imported
+        dirName = os.path.dirname(__file__)
+        self.pluginPaths = [os.path.join(dirName, path) for path in self.projDef.get('Plugins', ['plugins'])]
+        Registry.Discover(self.pluginPaths)
+        for deviceType in sorted({device['type'] for devices in self.Places.values() for device in devices.values()}):
+            Registry.Lookup(deviceType)
+
+    def StartWorkers(self):
+        #"Workers" in project.json spreads the places over that many simulation processes
+        count = self.projDef.get('Workers', 0)
+        if count:
+            clock = self.engine.clock
+            config = {"Seed": self.Seed, "Clock": (clock.Mode, clock.Scale, clock.Tick), "Adaptive": self.engine.adaptive,
+                      "Plugins": self.pluginPaths}
+            self.engine.workers = WorkerPool(self.Plant, self.devicesDef, count, config)
+
+    def write_RunManifest(self):
+        dirName = os.path.dirname(__file__)
+        manifest = {
+            "Project Name": self.projDef.get("Project Name"),
+            "Seed": self.Seed,
+            "Clock": {"Mode": self.engine.clock.Mode, "Scale": self.engine.clock.Scale, "Tick": self.engine.clock.Tick,
+                      "Adaptive": self.engine.adaptive},
+            "Started": datetime.now().isoformat(timespec='seconds'),
+            "Files": {}
+        }
+        for filename in ("project.json", "devices.json", "places.json"):
+            with open(os.path.join(dirName, filename), 'rb') as fp:
+                manifest["Files"][filename] = hashlib.sha256(fp.read()).hexdigest()
+        with open(os.path.join(dirName, "run_manifest.json"), 'w') as fp:
+            json.dump(manifest, fp, indent=4)
+
     def InitUi(self):
         self.InitVar()
         self.InitCheckBoxes()
@@ -569,6 +1273,8 @@ class MainWindow(QMainWindow):
         self.ui.cmbPlace.currentIndexChanged.connect(self.update_DevicesTree)
         self.update_DevicesTree()
         self.ui.treeDevices.itemClicked.connect(self.on_tree_item_clicked)
+        self.ui.treeDevices.setContextMenuPolicy(Qt.CustomContextMenu)# type: ignore
+        self.ui.treeDevices.customContextMenuRequested.connect(self.on_tree_context_menu)
         self.select_first_TreeItem()
         self.ui.tblAnalog.itemChanged.connect(self.on_cell_changed)
         self.ui.tblSettings.itemChanged.connect(self.on_cell_changed)
@@ -579,55 +1285,63 @@ class MainWindow(QMainWindow):
         self.ui.chkPreloadStatus.clicked.connect(self.on_chkPreloadStatus_toggled)
         self.ui.btnReload.clicked.connect(self.on_reload_button_clicked)
         self.ui.btnConfigure.clicked.connect(self.on_configure_button_clicked)
+        #Devices marked "simulate" in places.json start simulating on load
+        self.set_Simulation(self.Plant.DevicesWhere(lambda deviceDecl: deviceDecl.get('simulate')), True)
+        self.simulationChanged = False
+        self.init_StatusBar()
         #Initiate Threads
         self.init_Threads()
 
+    def init_StatusBar(self):
+        #The window has a fixed size, grow it by the status bar
+        self.setFixedSize(self.width(), self.height() + self.statusBar().sizeHint().height())
+        self.statusTimer = QTimer(self)
+        self.statusTimer.timeout.connect(self.update_StatusBar)
+        self.statusTimer.start(1000)
+
+    def update_StatusBar(self):
+        ticks = self.engine.ticks
+        share = ticks.Overruns / ticks.Ticks * 100 if ticks.Ticks else 0
+        message = f"Ticks {ticks.Ticks}   Overruns {ticks.Overruns} ({share:.1f}%)   Last {ticks.Last*1000:.1f} ms   Max {ticks.Max*1000:.1f} ms"
+        if self.engine.noiseJob.interval > NOISE_INTERVAL:
+            message += f"   Noise every {self.engine.noiseJob.interval:g} s"
+        self.statusBar().showMessage(message)
+
     def init_Threads(self):
-        self.device_lock = threading.Lock()
-        self.read_thread = threading.Thread(target=self.read_values)
-        self.read_thread.daemon = True
-        self.read_thread.start()
-        # Create a new event loop
-        self.loop = asyncio.new_event_loop()
-        # Set the event loop as the event loop for the current context
-        asyncio.set_event_loop(self.loop)
-        # Schedule simulate_objects to run on the event loop
-        self.simulator_task = self.loop.create_task(self.simulate_objects())
-        # Run the event loop in a new thread
-        self.simulator_thread = threading.Thread(target=self.loop.run_forever)
-        self.simulator_thread.daemon = True
-        self.simulator_thread.start()
+        #Values are read on the GUI thread, from the engine loop
+        self.readTimer = QTimer(self)
+        self.readTimer.timeout.connect(self.read_values)
+        self.readTimer.start(250)
         
     def stop_Threads(self):
-        if self.read_thread is not None:
-            self.read_thread = None
-        if self.simulator_thread is not None:
-            self.simulator_thread = None
-        self.loop.call_soon_threadsafe(self.loop.stop)
-        if self.simulator_task is not None:
-            self.simulator_task.cancel()
-            self.simulator_task = None
+        self.readTimer.stop()
+        self.engine.stop()
         
     def read_values(self):
-        while self.read_thread is not None:
-            with self.device_lock:
-                device = self.get_current_device()
-                self.update_UiValues(device)
-            sleep(0.25)
-            
-    async def simulate_objects(self):
-        while self.simulator_thread is not None:
-            with self.device_lock:
-                if self.simulatorList:
-                    tasks = [object.Simulate() for object in self.simulatorList]
-                    try:
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
-                        for result in results:
-                            if isinstance(result, Exception):
-                                print(f"Error of Object: {result}")
-                    except Exception as e:
-                        print(f"Error Desc: {e}")
-            await asyncio.sleep(0.25)
+        device = self.get_current_device()
+        #Only repaint when the selected device or its registers changed
+        #Registers written by worker processes are not in this process's change journal
+        remote = device in self.simulatedDevices and self.engine.is_remote(device)
+        sequence = None if device is not self.uiDevice or remote else self.uiSequence
+        if self.engine.serverError and self.ui.lblServStatus.text() != "SERVER ERROR":
+            self.ui.lblServStatus.setText("SERVER ERROR")
+        try:
+            values = self.engine.call(self.read_DeviceValues, device, sequence)
+        except (TimeoutError, RuntimeError):
+            return
+        if values is not None:
+            self.uiDevice = device
+            self.uiSequence = values[0]
+            self.update_UiValues(*values[1:])
+
+    @staticmethod
+    def read_DeviceValues(device, sequence):
+        #Runs on the engine loop, None when the registers did not change since sequence
+        if sequence is not None and not device.ChangedSince(sequence):
+            return None
+        vector = lambda tag: tag.Value if tag else None
+        return (device.Sequence, vector(device.Status01), vector(device.Status02), vector(device.Control01),
+                [tag.Value for tag in device.Analog], [tag.Value for tag in device.Settings])
     
     def InitCheckBoxes(self):
         self.status01 = [getattr(self.ui, f'chkStatus01_{i:02d}') for i in range(16)]
@@ -646,8 +1360,8 @@ class MainWindow(QMainWindow):
     def Status01_toggled(self, checkboxes):
         value = self.calculate_checkboxes(checkboxes)
         device = self.get_current_device()
-        if device.Status01.Value is not None:
-            device.Status01.Value = value
+        if device.Status01:
+            self.engine.post(self.engine.write_device, device, [(device.Status01, value)])
             self.ui.lblStatus01Value.setText(f"{value}")
             self.ui.chkPreloadStatus.setChecked(False)
             device.StatusLoad = False
@@ -655,8 +1369,8 @@ class MainWindow(QMainWindow):
     def Status02_toggled(self, checkboxes):
         value = self.calculate_checkboxes(checkboxes)
         device = self.get_current_device()
-        if device.Status02.Value is not None:
-            device.Status02.Value = value
+        if device.Status02:
+            self.engine.post(self.engine.write_device, device, [(device.Status02, value)])
             self.ui.lblStatus02Value.setText(f"{value}")
             self.ui.chkPreloadStatus.setChecked(False)
             device.StatusLoad = False
@@ -664,8 +1378,8 @@ class MainWindow(QMainWindow):
     def Control01_toggled(self, checkboxes):
         value = self.calculate_checkboxes(checkboxes)
         device = self.get_current_device()
-        if device.Control01.Value is not None:
-            device.Control01.Value = value
+        if device.Control01:
+            self.engine.post(self.engine.write_device, device, [(device.Control01, value)])
             self.ui.lblControl01Value.setText(f"{value}")
 
     def calculate_checkboxes(self, checkboxes):
@@ -692,7 +1406,7 @@ class MainWindow(QMainWindow):
         self.ui.treeDevices.clear()
         for device in place.Devices:
             treeDict[device] = QTreeWidgetItem([place.Devices[device].Name,device])
-            if place.Devices[device].Simulate:
+            if place.Devices[device] in self.simulatedDevices:
                 treeDict[device].setForeground(0, QBrush(QColor(0, 200, 0)))
             if place.Devices[device].ParentKey == None:
                 self.ui.treeDevices.addTopLevelItem(treeDict[device])
@@ -704,7 +1418,8 @@ class MainWindow(QMainWindow):
     def on_tree_item_clicked(self, item, column):
         device = self.get_current_device()
         self.update_UiLabels(device)
-        self.update_UiValues(device)
+        self.uiDevice = None
+        self.read_values()
     
     def get_current_device(self):
         place = self.Plant.Places[self.ui.cmbPlace.currentData()]
@@ -725,15 +1440,16 @@ class MainWindow(QMainWindow):
     def update_UiLabels(self,device):
         self.ui.lblDeviceType.setText(device.Type)
         self.ui.spnSimScale.setValue(device.SimScale*100)
-        self.ui.chkSimulate.setChecked(device.Simulate)
+        self.ui.chkSimulate.setChecked(device in self.simulatedDevices)
         self.ui.chkSimulate.setDisabled(not device.EnableSimulate)
-        self.set_disable_simcoltrols(device.Simulate)
+        self.set_disable_simcoltrols(device in self.simulatedDevices)
         self.ui.chkPreloadSettings.setChecked(device.SettingsLoad)
         self.ui.chkPreloadAnalog.setChecked(device.AnalogLoad)
         self.ui.chkPreloadStatus.setChecked(device.StatusLoad)
         self.update_Ui_ChkLabels(device.Status01,'Status01', self.ui.lblStatus01Address, self.status01, device.Type)
         self.update_Ui_ChkLabels(device.Status02,'Status02', self.ui.lblStatus02Address, self.status02, device.Type)
         self.update_Ui_ChkLabels(device.Control01,'Control01', self.ui.lblControl01Address, self.control01, device.Type)
+        self.update_Ui_BitAddresses(device)
         self.update_Ui_Table(device,self.ui.tblAnalog,'Analog')
         self.update_Ui_Table(device,self.ui.tblSettings,'Settings')
             
@@ -752,10 +1468,10 @@ class MainWindow(QMainWindow):
             table.setItem(i,0,item)
         table.blockSignals(False)        
     
-    def update_Ui_TableValues(self,tagList,table):
+    def update_Ui_TableValues(self,values,table):
         table.blockSignals(True)
-        for i, Tag in enumerate(tagList):
-            new_value = f"{tagList[i].Value}"
+        for i, value in enumerate(values):
+            new_value = f"{value}"
             current_item = table.item(i, 1)
             if current_item is None or current_item.text() != new_value:
                 table.setItem(i, 1, QTableWidgetItem(new_value))
@@ -785,17 +1501,27 @@ class MainWindow(QMainWindow):
                 checkbox.setChecked(False)
                 checkbox.setDisabled(True)          
              
-    def update_UiValues(self,device):
-        self.update_Ui_ChkValues(device.Status01,self.status01,self.ui.lblStatus01Value)
-        self.update_Ui_ChkValues(device.Status02,self.status02,self.ui.lblStatus02Value)
-        self.update_Ui_ChkValues(device.Control01,self.control01,self.ui.lblControl01Value)
-        self.update_Ui_TableValues(device.Analog,self.ui.tblAnalog)
-        self.update_Ui_TableValues(device.Settings,self.ui.tblSettings)
+    def update_Ui_BitAddresses(self,device):
+        labels = {'Status01':self.ui.lblStatus01Address,'Status02':self.ui.lblStatus02Address,'Control01':self.ui.lblControl01Address}
+        for vector,label in labels.items():
+            if vector in device.CoilAddress:
+                label.setToolTip(f"Coils: {device.CoilAddress[vector]:05d} - {device.CoilAddress[vector]+15:05d}")
+            elif vector in device.InputAddress:
+                label.setToolTip(f"Discrete Inputs: {100000 + device.InputAddress[vector]} - {100000 + device.InputAddress[vector]+15}")
+            else:
+                label.setToolTip("")
+             
+    def update_UiValues(self,status01,status02,control01,analog,settings):
+        self.update_Ui_ChkValues(status01,self.status01,self.ui.lblStatus01Value)
+        self.update_Ui_ChkValues(status02,self.status02,self.ui.lblStatus02Value)
+        self.update_Ui_ChkValues(control01,self.control01,self.ui.lblControl01Value)
+        self.update_Ui_TableValues(analog,self.ui.tblAnalog)
+        self.update_Ui_TableValues(settings,self.ui.tblSettings)
         
-    def update_Ui_ChkValues(self, status, checkboxes,label):
-        if status:
-            self.populate_checkboxes(checkboxes,status.Value)
-            label.setText(f"{status.Value}")
+    def update_Ui_ChkValues(self, value, checkboxes,label):
+        if value is not None:
+            self.populate_checkboxes(checkboxes,value)
+            label.setText(f"{value}")
         else:
             label.setText("--")
             for checkbox in checkboxes:
@@ -805,41 +1531,97 @@ class MainWindow(QMainWindow):
         if item.isSelected():
             device = self.get_current_device()
             if item.tableWidget() == self.ui.tblAnalog:
-                if (type(device.Analog[item.row()]) == LongTag) and (device.Analog[item.row()].Value != int(item.text())):
-                    device.Analog[item.row()].Value = int(item.text())
-                elif device.Analog[item.row()].Value != float(item.text()):
-                    device.Analog[item.row()].Value = float(item.text())
+                tag = device.Analog[item.row()]
+                value = int(item.text()) if type(tag) == LongTag else float(item.text())
+                self.engine.post(self.engine.write_device, device, [(tag, value)])
                 self.ui.chkPreloadAnalog.setChecked(False)
                 device.AnalogLoad = False
             elif item.tableWidget() == self.ui.tblSettings:
-                if (type(device.Settings[item.row()]) == LongTag) and (device.Settings[item.row()].Value != int(item.text())):
-                    device.Settings[item.row()].Value = int(item.text())
-                elif device.Settings[item.row()].Value != float(item.text()):
-                    device.Settings[item.row()].Value = float(item.text())
+                tag = device.Settings[item.row()]
+                value = int(item.text()) if type(tag) == LongTag else float(item.text())
+                self.engine.post(self.engine.write_device, device, [(tag, value)])
                 self.ui.chkPreloadSettings.setChecked(False)
                 device.SettingsLoad = False
 
     
     def on_chkSimulate_toggled(self, state):
-        device = self.get_current_device()
-        value = self.ui.chkSimulate.isChecked()
-        if value:
-            if device.Simulator is None:
-                print(f"Simulating --- {self.ui.cmbPlace.currentText()} --- {device.Name}")
-                device.AddSimulator()
-                self.simulatorList.append(device.Simulator)
-                self.set_disable_simcoltrols(True)
-                self.ui.treeDevices.currentItem().setForeground(0, QBrush(QColor(0, 200, 0)))
-                #size = asizeof.asizeof(self.simulatorList)
-                #print(f"Size of simulatorList: {size} bytes")
+        self.set_Simulation([self.get_current_device()], self.ui.chkSimulate.isChecked())
+
+    def on_tree_context_menu(self, position):
+        item = self.ui.treeDevices.itemAt(position)
+        if item is None:
+            return
+        place = self.Plant.Places[self.ui.cmbPlace.currentData()]
+        device = place.Devices[item.text(1)]
+        #Targets are resolved when an action is picked, stopping never creates devices of unopened places
+        targets = [(f"place {place.Name}", lambda create: list(place.Devices.values())),
+                   (f"all {device.Type}", lambda create: self.Plant.DevicesWhere(lambda deviceDecl: deviceDecl['type'] == device.Type, create)),
+                   ("whole plant", lambda create: self.Plant.DevicesWhere(lambda deviceDecl: True, create))]
+        menu = QMenu(self)
+        for label, targetDevices in targets:
+            menu.addAction(f"Simulate {label}", lambda targetDevices=targetDevices: self.set_Simulation(targetDevices(True), True, True))
+            menu.addAction(f"Stop simulating {label}", lambda targetDevices=targetDevices: self.set_Simulation(targetDevices(False), False, True))
+        menu.addSeparator()
+        menu.addAction("Top devices...", self.show_ProfileDialog)
+        menu.exec(self.ui.treeDevices.viewport().mapToGlobal(position))
+
+    def show_ProfileDialog(self):
+        self.profileDialog = ProfileDialog(self.engine, self)
+        self.profileDialog.show()
+
+    def set_Simulation(self, devices, state: bool, save: bool = False):
+        #Switch a batch of devices with one engine command and one repaint
+        if state:
+            devices = [device for device in devices if device.EnableSimulate and device not in self.simulatedDevices]
+            self.simulatedDevices.update(devices)
+            self.engine.post(self.engine.add_simulators, devices)
         else:
-            if device.Simulator:
-                print(f"Stop simulating --- {self.ui.cmbPlace.currentText()} --- {device.Name}")
-                self.simulatorList.remove(device.Simulator)
-                device.RemoveSimulator()
-                self.set_disable_simcoltrols(False)
-                self.ui.treeDevices.currentItem().setForeground(0, QBrush(QColor(0, 0, 0)))
-        self.ui.lblSimDev.setText(f"{len(self.simulatorList)}")
+            devices = [device for device in devices if device in self.simulatedDevices]
+            self.simulatedDevices.difference_update(devices)
+            self.engine.post(self.engine.remove_simulators, devices)
+        if devices:
+            action = 'Simulating' if state else 'Stop simulating'
+            if len(devices) == 1:
+                print(f"{action} --- {self.ui.cmbPlace.currentText()} --- {devices[0].Name}")
+            else:
+                print(f"{action} --- {len(devices)} devices")
+            self.simulationChanged = True
+        self.update_TreeColors()
+        if self.ui.treeDevices.currentItem():
+            simulated = self.get_current_device() in self.simulatedDevices
+            self.ui.chkSimulate.setChecked(simulated)
+            self.set_disable_simcoltrols(simulated)
+        self.ui.lblSimDev.setText(f"{len(self.simulatedDevices)}")
+        if save:
+            self.save_SimulatedDevices()
+
+    def update_TreeColors(self):
+        place = self.Plant.Places[self.ui.cmbPlace.currentData()]
+        items = [self.ui.treeDevices.topLevelItem(i) for i in range(self.ui.treeDevices.topLevelItemCount())]
+        while items:
+            item = items.pop()
+            items += [item.child(i) for i in range(item.childCount())]
+            simulated = place.Devices[item.text(1)] in self.simulatedDevices
+            item.setForeground(0, QBrush(QColor(0, 200, 0) if simulated else QColor(0, 0, 0)))
+
+    def save_SimulatedDevices(self):
+        #Only the simulate flags are written back, places.json may have been edited in the configuration dialog meanwhile
+        if not self.simulationChanged:
+            return
+        placesDecl = Helper.loadJson("places.json")
+        for placeKey, place in self.Plant.Places.items():
+            if not place.Loaded:
+                continue
+            for deviceKey, device in place.Devices.items():
+                deviceDecl = placesDecl.get(placeKey, {}).get(deviceKey)
+                if deviceDecl is None:
+                    continue
+                if device in self.simulatedDevices:
+                    deviceDecl['simulate'] = True
+                else:
+                    deviceDecl.pop('simulate', None)
+        Helper.saveJson("places.json", placesDecl)
+        self.simulationChanged = False
     
     def set_disable_simcoltrols(self, state):
         self.ui.chkPreloadSettings.setDisabled(state)
@@ -849,41 +1631,35 @@ class MainWindow(QMainWindow):
     
     def on_spnSimScale_valueChanged(self, value):
         device = self.get_current_device()
-        device.SimScale = value/100
-        if device.Simulator:
-            device.Simulator.SimScale = value/100
+        if device.SimScale != value/100:
+            self.engine.post(self.engine.set_sim_scale, device, value/100)
     
     def on_chkPreloadSettings_toggled(self, state):
         device = self.get_current_device()
         device.SettingsLoad = self.ui.chkPreloadSettings.isChecked()
         if device.SettingsLoad:
             deviceDecl = self.get_current_device_decl()
-            device.LoadSettings(deviceDecl)
+            self.engine.post(device.LoadSettings, deviceDecl)
         else:
-            for setting in device.Settings:
-                setting.Value = 0
+            self.engine.post(self.engine.write_device, device, [(setting, 0) for setting in device.Settings])
             
     def on_chkPreloadAnalog_toggled(self, state):
         device = self.get_current_device()
         device.AnalogLoad = self.ui.chkPreloadAnalog.isChecked()
         if device.AnalogLoad:
             deviceDecl = self.get_current_device_decl()
-            device.LoadAnalog(deviceDecl)
+            self.engine.post(device.LoadAnalog, deviceDecl)
         else:
-            for analog in device.Analog:
-                analog.Value = 0
+            self.engine.post(self.engine.write_device, device, [(analog, 0) for analog in device.Analog])
 
     def on_chkPreloadStatus_toggled(self, state):
         device = self.get_current_device()
         device.StatusLoad = self.ui.chkPreloadStatus.isChecked()
         if device.StatusLoad:
             deviceDecl = self.get_current_device_decl()
-            device.LoadStatus(deviceDecl)
+            self.engine.post(device.LoadStatus, deviceDecl)
         else:
-            if device.Status01:
-                device.Status01.Value = 0
-            if device.Status02:
-                device.Status02.Value = 0
+            self.engine.post(self.engine.write_device, device, [(status, 0) for status in (device.Status01, device.Status02) if status])
 
     def on_configure_button_clicked(self):
         self.dialog = ConfigDialog()
@@ -933,13 +1709,22 @@ class ConfigDialog(QDialog):
         self.PlantDef = Helper.loadJson("project.json")
         self.PlacesDecl = Helper.loadJson("places.json")
         self.DevicesDef = Helper.loadJson("devices.json")
-        self.ui.lblAvilableAddress.setText(f"{self.PlantDef['AddressCount']+400000}")
+        self.Allocator = AddressAllocator(self.PlantDef.get('UnitIDs'))
+        conflicts = self.Allocator.Load(self.PlacesDecl,self.DevicesDef)
+        self.update_address_count()
         self.load_Places(self.PlacesDecl)
         self.load_device_def(self.DevicesDef)
         self.ui.btnSave.setDisabled(False)
         self.disbale_place_controls(False)
         self.ui.btnReSeqAddress.setDisabled(False)
         self.clear_place_controls()
+        if conflicts:
+            QMessageBox.warning(self, "Address Conflicts", f"{len(conflicts)} address conflicts found:\n" + "\n".join(conflicts[:20]))
+
+    def update_address_count(self):
+        #Next address above every used range, kept in project.json for older tools
+        self.PlantDef['AddressCount'] = self.Allocator.End()
+        self.ui.lblAvilableAddress.setText(f"{self.PlantDef['AddressCount']+400000}")
 
     def on_save_button_clicked(self):
         response = QMessageBox.question(self, 'Save', "Do you want to save the changes?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)# type: ignore
@@ -1097,11 +1882,13 @@ class ConfigDialog(QDialog):
             if new_place_alias in self.PlacesDecl:
                 QMessageBox.warning(self, "Warning", "Place Alias already exists !")
             else:
-                place_address = self.PlantDef['AddressCount']
                 place_registers = self.DevicesDef['Root']['Registers']
+                place_address = self.Allocator.Allocate(f"{new_place_alias}/{new_place_alias}",place_registers)
+                if place_address is None:
+                    QMessageBox.warning(self, "Warning", "No free address range left for the Place !")
+                    return
                 self.PlacesDecl[new_place_alias] = {new_place_alias:{"name":new_place,"address":place_address,"parent":None,"type":"Root","link":None,"status01":None,"status02":None,"analog":None,"settings":None,"simscale":0.75}}
-                self.PlantDef['AddressCount'] += place_registers
-                self.ui.lblAvilableAddress.setText(f"{self.PlantDef['AddressCount']+400000}")
+                self.update_address_count()
                 self.load_Places(self.PlacesDecl)
                 self.ui.txtNewPlace.clear()
                 self.ui.txtPlaceAlias.clear()
@@ -1114,7 +1901,10 @@ class ConfigDialog(QDialog):
             response = QMessageBox.warning(self, "Warning", "Are you sure you want to remove this Place ?",QMessageBox.Yes | QMessageBox.No)# type: ignore
             if response == QMessageBox.Yes:# type: ignore
                 place = self.ui.lstPlaces.currentItem().data(Qt.UserRole) # type: ignore
+                for device in self.PlacesDecl[place]:
+                    self.Allocator.Free(f"{place}/{device}")
                 del self.PlacesDecl[place]
+                self.update_address_count()
                 self.load_Places(self.PlacesDecl)
                 self.ui.treeDevices.clear()
                 self.clear_definitions()
@@ -1173,6 +1963,15 @@ class ConfigDialog(QDialog):
                     self.load_Places(self.PlacesDecl)
                     self.clear_place_controls()
                 else:
+                    if new_place_alias in self.PlacesDecl:
+                        QMessageBox.warning(self, "Warning", "Place Alias already exists !")
+                        return
+                    if self.Allocator.Unit(new_place_alias) != self.Allocator.Unit(place_alias):
+                        QMessageBox.warning(self, "Warning", "Place Alias maps to another Unit ID !\nUpdate UnitIDs in project.json first.")
+                        return
+                    for device in self.PlacesDecl[place_alias]:
+                        newDevice = new_place_alias if device == place_alias else device
+                        self.Allocator.Rename(f"{place_alias}/{device}",f"{new_place_alias}/{newDevice}")
                     self.PlacesDecl = self.replace_key(self.PlacesDecl,place_alias,new_place_alias)
                     self.PlacesDecl[new_place_alias] = self.replace_key(self.PlacesDecl[new_place_alias],place_alias,new_place_alias)
                     self.PlacesDecl[new_place_alias][new_place_alias]['name'] = new_place
@@ -1218,11 +2017,13 @@ class ConfigDialog(QDialog):
         if device_alias in self.PlacesDecl[device_place_alias]:
             QMessageBox.warning(self, "Warning", "Device Alias already exists !")
             return
-        device_address = self.PlantDef['AddressCount']
         device_registers = self.DevicesDef[device_type]['Registers']
+        device_address = self.Allocator.Allocate(f"{device_place_alias}/{device_alias}",device_registers)
+        if device_address is None:
+            QMessageBox.warning(self, "Warning", "No free address range left for the Device !")
+            return
         self.PlacesDecl[device_place_alias][device_alias] = {"name":device_name,"address":device_address,"parent":device_parent,"type":device_type,"link":None,"status01":None,"status02":None,"analog":None,"settings":None,"simscale":0.75}
-        self.PlantDef['AddressCount'] += device_registers
-        self.ui.lblAvilableAddress.setText(f"{self.PlantDef['AddressCount']+400000}")
+        self.update_address_count()
         self.PlacesDecl[device_place_alias] = self.reconfigure(self.PlacesDecl[device_place_alias])
         self.on_place_item_clicked(self.ui.lstPlaces.currentItem())
     
@@ -1238,8 +2039,11 @@ class ConfigDialog(QDialog):
                 if self.ui.treeDevices.currentItem().childCount() > 0:
                     for i in range(self.ui.treeDevices.currentItem().childCount()):
                         child_alias = self.ui.treeDevices.currentItem().child(i).text(1)
+                        self.Allocator.Free(f"{place_alias}/{child_alias}")
                         del self.PlacesDecl[place_alias][child_alias]
+                self.Allocator.Free(f"{place_alias}/{device_alias}")
                 del self.PlacesDecl[place_alias][device_alias] # type: ignore
+                self.update_address_count()
                 self.PlacesDecl[place_alias] = self.reconfigure(self.PlacesDecl[place_alias]) # type: ignore
                 self.on_place_item_clicked(self.ui.lstPlaces.currentItem())
                 
@@ -1286,8 +2090,10 @@ class ConfigDialog(QDialog):
                     for i in range(self.ui.treeDevices.currentItem().childCount()):
                         child_alias = self.ui.treeDevices.currentItem().child(i).text(1)
                         new_child_alias = child_alias.replace(device_alias,new_device_alias)
+                        self.Allocator.Rename(f"{device_place_alias}/{child_alias}",f"{device_place_alias}/{new_child_alias}")
                         self.PlacesDecl[device_place_alias] = self.replace_key(self.PlacesDecl[device_place_alias],child_alias,new_child_alias)
                         self.PlacesDecl[device_place_alias][new_child_alias]['parent'] = new_device_alias
+                self.Allocator.Rename(f"{device_place_alias}/{device_alias}",f"{device_place_alias}/{new_device_alias}")
                 self.PlacesDecl[device_place_alias] = self.replace_key(self.PlacesDecl[device_place_alias],device_alias,new_device_alias)
                 self.PlacesDecl[device_place_alias][new_device_alias]['name'] = new_device_name
                 self.PlacesDecl[device_place_alias][new_device_alias]['type'] = new_device_type
@@ -1391,18 +2197,21 @@ class ConfigDialog(QDialog):
                 self.get_current_device_decl()['link'] = self.ui.cmbLink.currentText()
     
     def on_reseq_address_button_clicked(self):
-        passwd = QInputDialog.getText(self, 'Password', 'Please Enter the password:', QLineEdit.Password)# type: ignore
-        if passwd == ('1111', True):
-            if self.ui.lstPlaces.count() > 0:
-                addressCount:int = 0
-                for place in self.PlacesDecl:
-                    for device in self.PlacesDecl[place]:
-                        devType = self.PlacesDecl[place][device]['type']
-                        addressLen = self.DevicesDef[devType]['Registers']
-                        self.PlacesDecl[place][device]['address'] = addressCount
-                        addressCount += addressLen
-                self.ui.lblAvilableAddress.setText(f"{addressCount + 400000}")
-                self.PlantDef['AddressCount'] = addressCount
+        #Packs the devices of the selected place only, other places keep their addresses
+        if self.ui.lstPlaces.currentItem():
+            place = self.ui.lstPlaces.currentItem().data(Qt.UserRole) # type: ignore
+            response = QMessageBox.question(self, 'Resequence', f"Resequence the addresses of {place} ?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)# type: ignore
+            if response != QMessageBox.Yes: # type: ignore
+                return
+            try:
+                addresses = self.Allocator.Resequence([f"{place}/{device}" for device in self.PlacesDecl[place]])
+            except ValueError as e:
+                QMessageBox.warning(self, "Warning", str(e))
+                self.Allocator.Load(self.PlacesDecl,self.DevicesDef)
+                return
+            for device in self.PlacesDecl[place]:
+                self.PlacesDecl[place][device]['address'] = addresses[f"{place}/{device}"]
+            self.update_address_count()
                 
     def closeEvent(self, event):
         if self.ui.btnSave.isEnabled():
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class TankModel:
+    # Levels of simulated tanks integrate the flows of the pumps and valves linked to them, all tanks in one
+    # vectorised update. Actuators declare their links in places.json,
+    #   "flow": [{"tank": "Tank_01_LIT", "rate": -0.05}]
+    # rate being level units per second at full output, negative when the actuator drains the tank.
+    # The "Flow" entry of the actuator type in devices.json says what full output is:
+    #   {"Active": ["Status01", 0], "Output": ["Analog", 0], "Full": ["Settings", 0]}
+    # Active is a status bit that must be set, Output / Full scale the flow and may be left out
+    def __init__(self, clock):
+        self.clock = clock
+        self.tanks = []
+        self.banks = []
+        self.layout = None
+        self.last = None
+
+    def Add(self, device):
+        if device not in self.tanks:
+            self.tanks.append(device)
+            self.layout = None
+
+    def Remove(self, device):
+        if device in self.tanks:
+            self.tanks.remove(device)
+            self.layout = None
+
+    def Invalidate(self):
+        #Flow links changed, the layout is built again on the next update
+        self.layout = None
+
+    def BankIndex(self, bank):
+        if bank not in self.banks:
+            self.banks.append(bank)
+        return self.banks.index(bank)
+
+    def Source(self, device, reference):
+        # Bank, address, scale and sign of a single register tag given as [vector or tag list, index]
+        group, index = reference
+        tag = getattr(device, group)[index] if group in ('Analog', 'Settings') else getattr(device, group)
+        if tag is None:
+            raise ValueError(f"{device.Type} has no {group} for its flow")
+        codec = getattr(tag, 'Codec', 'int')
+        if codec not in ('int', 'Sint'):
+            raise ValueError(f"Flow tag {group} {index} of {device.Type} must be a single register")
+        scale = 10**tag.decimalPoints if hasattr(tag, 'decimalPoints') else 1
+        return self.BankIndex(device.Image.bank), tag.Address, scale, codec == 'Sint'
+
+    def Build(self):
+        self.banks = []
+        tanks = sorted(self.tanks, key=lambda tank: (id(tank.Image.bank), tank.Analog[0].Address))
+        levels = [self.Source(tank, ('Analog', 0)) for tank in tanks]
+        limits = [(self.Source(tank, ('Settings', 4)), self.Source(tank, ('Settings', 5))) if len(tank.Settings) >= 6 else None for tank in tanks]
+        links = []
+        for index, tank in enumerate(tanks):
+            for actuator, rate, spec in tank.Inflows:
+                active = self.Source(actuator, spec['Active']) if spec.get('Active') else None
+                output = self.Source(actuator, spec['Output']) if spec.get('Output') else None
+                full = spec.get('Full', 1)
+                full = self.Source(actuator, full) if isinstance(full, list) else full
+                links.append((index, rate, active, 1 << spec['Active'][1] if active else 0, output, full))
+        self.layout = {
+            'count': len(tanks),
+            'level': self.Columns(levels),
+            'limited': np.array([limit is not None for limit in limits], dtype=bool),
+            'minimum': self.Columns([limit[0] for limit in limits if limit]),
+            'maximum': self.Columns([limit[1] for limit in limits if limit]),
+            'tank': np.array([link[0] for link in links], dtype=np.int64),
+            'rate': np.array([link[1] for link in links], dtype=np.float64),
+            'mask': np.array([link[3] for link in links], dtype=np.int64),
+            'active': self.Columns([link[2] for link in links if link[2]]),
+            'hasActive': np.array([link[2] is not None for link in links], dtype=bool),
+            'output': self.Columns([link[4] for link in links if link[4]]),
+            'hasOutput': np.array([link[4] is not None for link in links], dtype=bool),
+            'full': self.Columns([link[5] for link in links if isinstance(link[5], tuple)]),
+            'fullIsTag': np.array([isinstance(link[5], tuple) for link in links], dtype=bool),
+            'fullValue': np.array([link[5] if not isinstance(link[5], tuple) else 1 for link in links], dtype=np.float64),
+        }
+        #Float state, so increments smaller than a register step still add up
+        self.level = self.Read(self.layout['level'])
+        self.written = self.Words(self.layout['level'])
+
+    @staticmethod
+    def Columns(sources):
+        banks, addresses, scales, signed = zip(*sources) if sources else ((), (), (), ())
+        return (np.array(banks, dtype=np.int64), np.array(addresses, dtype=np.int64),
+                np.array(scales, dtype=np.float64), np.array(signed, dtype=bool))
+
+    def Words(self, columns):
+        banks, addresses = columns[0], columns[1]
+        words = np.zeros(len(addresses), dtype=np.int64)
+        for index, bank in enumerate(self.banks):
+            selected = banks == index
+            if selected.any():
+                words[selected] = bank.Gather(addresses[selected])
+        return words
+
+    def Read(self, columns):
+        words = self.Words(columns)
+        words = np.where(columns[3] & (words >= 0x8000), words - 0x10000, words)
+        return words / columns[2]
+
+    def Update(self):
+        now = self.clock()
+        elapsed = 0 if self.last is None else now - self.last
+        self.last = now
+        if not self.tanks:
+            return
+        if self.layout is None:
+            self.Build()
+        layout = self.layout
+        #Levels written by clients or the UI since the last update replace the model state
+        words = self.Words(layout['level'])
+        external = words != self.written
+        if external.any():
+            self.level[external] = self.Read(layout['level'])[external]
+        flow = layout['rate'].copy()
+        if layout['hasActive'].any():
+            active = np.zeros(len(flow), dtype=bool)
+            active[layout['hasActive']] = (self.Words(layout['active']) & layout['mask'][layout['hasActive']]) != 0
+            flow[layout['hasActive'] & ~active] = 0
+        if layout['hasOutput'].any():
+            full = layout['fullValue'].copy()
+            if layout['fullIsTag'].any():
+                full[layout['fullIsTag']] = self.Read(layout['full'])
+            output = self.Read(layout['output']) / np.where(full[layout['hasOutput']] != 0, full[layout['hasOutput']], 1)
+            flow[layout['hasOutput']] *= np.clip(output, 0, 1)
+        self.level += elapsed * np.bincount(layout['tank'], flow, minlength=layout['count'])
+        if layout['limited'].any():
+            limited = self.level[layout['limited']]
+            self.level[layout['limited']] = np.clip(limited, self.Read(layout['minimum']), self.Read(layout['maximum']))
+        self.written = np.rint(self.level * layout['level'][2]).astype(np.int64) & 0xFFFF
+        banks, addresses = layout['level'][0], layout['level'][1]
+        for index, bank in enumerate(self.banks):
+            selected = banks == index
+            if selected.any():
+                bank.Scatter(addresses[selected], self.written[selected].astype(np.uint16))
+
+    def __len__(self):
+        return len(self.tanks)
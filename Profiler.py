@@ -0,0 +1,105 @@
+import numpy as np
+
+SAMPLES = 1024
+
+
+class ProfileRecord:
+    # Cost of one simulated device: simulate() passes, the scheduler jobs it created and its register traffic
+    def __init__(self, device):
+        self.device = device
+        self.Calls = 0
+        self.Total = 0.0
+        self.samples = np.zeros(SAMPLES, dtype=np.float64)
+        self.JobCalls = 0
+        self.JobTotal = 0.0
+        self.JobsCreated = 0
+        #Register reads and writes of the device's passes and jobs, UI reads of the same image are not counted
+        self.Reads = 0
+        self.Writes = 0
+        self.Errors = 0
+        self.LastError = ''
+
+    def Mark(self):
+        image = self.device.Image
+        return image.Reads, image.Writes
+
+    def Count(self, mark):
+        #Traffic of the device image since mark
+        reads, writes = self.Mark()
+        self.Reads += reads - mark[0]
+        self.Writes += writes - mark[1]
+
+    def Add(self, elapsed: float, mark=None):
+        self.samples[self.Calls % SAMPLES] = elapsed
+        self.Calls += 1
+        self.Total += elapsed
+        if mark is not None:
+            self.Count(mark)
+
+    def AddJob(self, elapsed: float, mark=None):
+        self.JobCalls += 1
+        self.JobTotal += elapsed
+        if mark is not None:
+            self.Count(mark)
+
+    def Error(self, error: Exception):
+        self.Errors += 1
+        self.LastError = str(error)
+
+    def Samples(self):
+        #Latest passes only, p99 follows the current behaviour rather than the whole run
+        return self.samples[:min(self.Calls, SAMPLES)]
+
+    def Stats(self):
+        samples = self.Samples()
+        return {
+            "Device": self.device.Key,
+            "Name": self.device.Name,
+            "Type": self.device.Type,
+            "Calls": self.Calls,
+            "Total": self.Total,
+            "Mean": self.Total / self.Calls if self.Calls else 0.0,
+            "P99": float(np.percentile(samples, 99)) if len(samples) else 0.0,
+            "Job Calls": self.JobCalls,
+            "Job Total": self.JobTotal,
+            "Jobs Created": self.JobsCreated,
+            "Reads": self.Reads,
+            "Writes": self.Writes,
+            "Errors": self.Errors,
+            "Last Error": self.LastError,
+        }
+
+
+class SimProfiler:
+    # Per device and per SimObj type counters of the simulation, read through Stats() and ByType()
+    def __init__(self):
+        self.records = {}
+
+    def Record(self, device):
+        record = self.records.get(device.Key)
+        if record is None:
+            record = self.records[device.Key] = ProfileRecord(device)
+        #A reloaded device is a new object under the same key
+        record.device = device
+        return record
+
+    def Reset(self):
+        self.records = {}
+
+    def Stats(self):
+        return [record.Stats() for record in list(self.records.values())]
+
+    @staticmethod
+    def ByType(stats: list):
+        # Totals per device type, p99 is the worst device p99 of the type
+        types = {}
+        for row in stats:
+            total = types.setdefault(row["Type"], {"Type": row["Type"], "Devices": 0, "Calls": 0, "Total": 0.0, "P99": 0.0,
+                                                   "Job Calls": 0, "Job Total": 0.0, "Jobs Created": 0, "Reads": 0, "Writes": 0, "Errors": 0})
+            total["Devices"] += 1
+            total["P99"] = max(total["P99"], row["P99"])
+            for key in ("Calls", "Total", "Job Calls", "Job Total", "Jobs Created", "Reads", "Writes", "Errors"):
+                total[key] += row[key]
+        for total in types.values():
+            total["Mean"] = total["Total"] / total["Calls"] if total["Calls"] else 0.0
+        return list(types.values())
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from Layout import WIDTHS, TypeLayout
+
+#Bump when the cached file layout changes, old caches are then rebuilt
+VERSION = 1
+CODECS = ('vector',) + tuple(WIDTHS)
+GROUPS = ('Vector', 'Analog', 'Settings')
+DEVICE = np.dtype([('unit', np.int32), ('address', np.int64), ('registers', np.int32), ('type', np.int32)])
+TAG = np.dtype([('address', np.int64), ('width', np.int8), ('codec', np.int8), ('dp', np.int8),
+                ('device', np.int32), ('group', np.int8), ('tag', np.int16)])
+
+
+#Run state saved in the declarations that the compiled map does not depend on
+VOLATILE = ('simulate',)
+
+
+def Declared(node):
+    #Declaration without the run state keys, toggling simulation keeps the cache valid
+    if isinstance(node, dict):
+        return {key: Declared(value) for key, value in node.items() if key not in VOLATILE}
+    if isinstance(node, list):
+        return [Declared(value) for value in node]
+    return node
+
+
+def SourceKey(paths):
+    # Hash of the layout relevant content of the project files the map is compiled from
+    digest = hashlib.sha256(str(VERSION).encode())
+    for path in paths:
+        with open(path, 'r') as fp:
+            digest.update(json.dumps(Declared(json.load(fp))).encode())
+    return digest.hexdigest()
+
+
+class RegisterMap:
+    # Flat, array backed register map of a plant: one row per device, one row per vector or tag and the
+    # initial register image of every unit. Compiled from places.json / devices.json and cached next to
+    # project.json, a valid cache is memory mapped instead of being compiled again
+    def __init__(self, key: str, keys: list, types: list, units: list, devices, tags, image):
+        self.Key = key
+        self.Keys = keys
+        self.Types = types
+        self.Units = units
+        self.spans = {span[0]: span for span in units}
+        self.index = None
+        self.Devices = devices
+        self.Tags = tags
+        self.image = image
+
+    @classmethod
+    def Compile(cls, placesDecl: dict, definitions: dict, units: dict, key: str = ''):
+        types = list(definitions)
+        layouts = {deviceType: TypeLayout(definition) for deviceType, definition in definitions.items()}
+        typeIndex = {deviceType: index for index, deviceType in enumerate(types)}
+        keys = []
+        rows = []
+        for place in placesDecl:
+            for name, deviceDecl in placesDecl[place].items():
+                keys.append(f"{place}/{name}")
+                deviceType = deviceDecl['type']
+                rows.append((units[place], deviceDecl['address'], definitions[deviceType]['Registers'], typeIndex[deviceType]))
+        devices = np.array(rows, dtype=DEVICE)
+        tags = [cls.TypeTags(layouts[deviceType], np.flatnonzero(devices['type'] == index), devices)
+                for index, deviceType in enumerate(types)]
+        tags = np.concatenate(tags) if tags else np.zeros(0, dtype=TAG)
+        tags = tags[np.argsort(tags['device'], kind='stable')]
+        #Dense image over the used span of each unit, then the settings preload per type in one pass each
+        spans = []
+        offset = 0
+        for unit in np.unique(devices['unit']):
+            selected = devices[devices['unit'] == unit]
+            start = int(selected['address'].min())
+            count = int((selected['address'] + selected['registers']).max()) - start
+            spans.append([int(unit), start, count, offset])
+            offset += count
+        image = np.zeros(offset, dtype=np.uint16)
+        #Image index of each device start address
+        bases = np.zeros(len(devices), dtype=np.int64)
+        for unit, start, count, base in spans:
+            selected = devices['unit'] == unit
+            bases[selected] = devices['address'][selected] - start + base
+        decls = [deviceDecl for place in placesDecl for deviceDecl in placesDecl[place].values()]
+        for index, deviceType in enumerate(types):
+            layout = layouts[deviceType]
+            selected = [device for device in np.flatnonzero(devices['type'] == index) if decls[device]['settings']]
+            if not layout.Settings or not selected:
+                continue
+            offsets, words = layout.Encode('Settings', [decls[device]['settings'] for device in selected])
+            image[(bases[selected][:, None] + offsets[None, :]).ravel()] = words.ravel()
+        return cls(key, keys, types, spans, devices, tags, image)
+
+    @staticmethod
+    def TypeTags(layout, devices, table):
+        # Tag rows of all devices of one type, the type template repeated at each device address
+        template = [(offset, 1, 0, 0, 0, index) for index, (vector, offset) in enumerate(layout.Vectors)]
+        for group, tags in ((1, layout.Analog), (2, layout.Settings)):
+            template += [(offset, WIDTHS[codec], CODECS.index(codec), decimalPoints, group, index)
+                         for index, (offset, codec, decimalPoints) in enumerate(tags)]
+        rows = np.zeros(len(devices) * len(template), dtype=TAG)
+        if not len(rows):
+            return rows
+        template = np.array(template, dtype=np.int64)
+        rows['address'] = (table['address'][devices][:, None] + template[:, 0][None, :]).ravel()
+        for column, field in enumerate(('width', 'codec', 'dp', 'group', 'tag'), start=1):
+            rows[field] = np.tile(template[:, column], len(devices))
+        rows['device'] = np.repeat(devices, len(template))
+        return rows
+
+    def Image(self, unit: int):
+        # Protocol start address and words of a unit's initial image
+        if unit not in self.spans:
+            return 0, self.image[:0]
+        spanUnit, start, count, offset = self.spans[unit]
+        return start, self.image[offset:offset + count]
+
+    def Index(self, key: str):
+        # Device row of a "place/device" key
+        if self.index is None:
+            self.index = {deviceKey: index for index, deviceKey in enumerate(self.Keys)}
+        return self.index[key]
+
+    def DeviceImage(self, key: str):
+        # Protocol address and initial words of one device, by its "place/device" key
+        unit, address, registers, deviceType = self.Devices[self.Index(key)].tolist()
+        start, words = self.Image(unit)
+        return address, words[address - start:address - start + registers]
+
+    def DeviceTags(self, device: int):
+        #Tag rows are sorted by device
+        start, stop = np.searchsorted(self.Tags['device'], [device, device + 1])
+        return self.Tags[start:stop]
+
+    def Save(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        #The header goes first and its key last, an interrupted save leaves a cache that does not validate
+        header = os.path.join(folder, 'map.json')
+        if os.path.exists(header):
+            os.remove(header)
+        #Arrays are replaced, not rewritten, a map still memory mapped by the running plant keeps its files
+        for name, array in (('devices', self.Devices), ('tags', self.Tags), ('image', self.image)):
+            np.save(os.path.join(folder, f'{name}.tmp.npy'), array)
+            os.replace(os.path.join(folder, f'{name}.tmp.npy'), os.path.join(folder, f'{name}.npy'))
+        with open(header, 'w') as fp:
+            json.dump({"Key": self.Key, "Keys": self.Keys, "Types": self.Types, "Units": self.Units}, fp)
+
+    @classmethod
+    def Load(cls, folder: str, key: str):
+        try:
+            with open(os.path.join(folder, 'map.json')) as fp:
+                header = json.load(fp)
+            if header["Key"] != key:
+                return None
+            arrays = [np.load(os.path.join(folder, name), mmap_mode='r') for name in ('devices.npy', 'tags.npy', 'image.npy')]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(key, header["Keys"], header["Types"], header["Units"], *arrays)
+
+    @classmethod
+    def Cached(cls, folder: str, sources: list, compile):
+        # Memory mapped map when the cache matches the sources, otherwise compile(key) and save it
+        key = SourceKey(sources)
+        registerMap = cls.Load(folder, key)
+        if registerMap is None:
+            registerMap = compile(key)
+            try:
+                registerMap.Save(folder)
+            except OSError as e:
+                print(f"Register map cache not saved: {e}")
+        return registerMap
+
+    def __len__(self):
+        return len(self.Devices)
@@ -0,0 +1,88 @@
+import ast
+import importlib.util
+import os
+from functools import partial
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = 'modbussim.simulators'
+
+
+class SimulatorRegistry:
+    # Device type -> SimObj class. Plugins are discovered without importing them and are
+    # only loaded the first time a device of one of their types is simulated
+    def __init__(self):
+        self.classes = {}
+        self.sources = {}
+
+    def Register(self, deviceType: str, simObjClass):
+        self.classes[deviceType] = simObjClass
+
+    def Simulates(self, *deviceTypes: str):
+        def register(simObjClass):
+            for deviceType in deviceTypes:
+                self.Register(deviceType, simObjClass)
+            return simObjClass
+        return register
+
+    def Discover(self, paths=()):
+        #Entry points are named after the device type they simulate
+        for entryPoint in entry_points(group=ENTRY_POINT_GROUP):
+            self.sources.setdefault(entryPoint.name, entryPoint.load)
+        for path in paths:
+            if not os.path.isdir(path):
+                continue
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith('.py') and not filename.startswith('_'):
+                    filePath = os.path.join(path, filename)
+                    for deviceType in self.Declared(filePath):
+                        self.sources.setdefault(deviceType, partial(self.LoadFile, filePath))
+
+    @staticmethod
+    def Declared(filePath: str):
+        # Device types named in @Simulates("...") decorators, read from the source without running it
+        try:
+            with open(filePath) as fp:
+                tree = ast.parse(fp.read(), filePath)
+        except (OSError, SyntaxError) as e:
+            print(f"Plugin error: {filePath}: {e}")
+            return []
+        deviceTypes = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                for decorator in node.decorator_list:
+                    if isinstance(decorator, ast.Call):
+                        function = decorator.func
+                        name = function.attr if isinstance(function, ast.Attribute) else getattr(function, 'id', None)
+                        if name == 'Simulates':
+                            deviceTypes += [arg.value for arg in decorator.args if isinstance(arg, ast.Constant) and isinstance(arg.value, str)]
+        return deviceTypes
+
+    @staticmethod
+    def LoadFile(filePath: str):
+        name = 'ModBusSimPlugin_' + os.path.splitext(os.path.basename(filePath))[0]
+        spec = importlib.util.spec_from_file_location(name, filePath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def Lookup(self, deviceType: str):
+        simObjClass = self.classes.get(deviceType)
+        if simObjClass is None and deviceType in self.sources:
+            loader = self.sources.pop(deviceType)
+            try:
+                loaded = loader()
+            except Exception as e:
+                print(f"Plugin error: {deviceType}: {e}")
+                return None
+            #Entry points may point straight at the class instead of a module using @Simulates
+            if isinstance(loaded, type) and deviceType not in self.classes:
+                self.Register(deviceType, loaded)
+            simObjClass = self.classes.get(deviceType)
+        return simObjClass
+
+    def Types(self):
+        return set(self.classes) | set(self.sources)
+
+
+Registry = SimulatorRegistry()
+Simulates = Registry.Simulates
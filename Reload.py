@@ -0,0 +1,54 @@
+class ReloadPlan:
+    # Device keys ("place/device") affected by a reload of places.json / devices.json
+    def __init__(self):
+        self.Removed = []
+        self.Added = []
+        #Same type at a new address, the current register values move with the device
+        self.Moved = []
+        #New type or a changed type definition, registers start from the new preload image
+        self.Replaced = []
+        #Name, parent, scale, preload or flow changes, the device stays and changed preloads are written again
+        self.Updated = []
+        #Places whose devices or flow links changed
+        self.Places = set()
+        #Device types whose definition changed
+        self.Types = set()
+
+    def Stopped(self):
+        return self.Removed + self.Moved + self.Replaced
+
+    def Created(self):
+        return self.Added + self.Moved + self.Replaced
+
+    def __len__(self):
+        return len(self.Removed) + len(self.Added) + len(self.Moved) + len(self.Replaced) + len(self.Updated)
+
+
+def PlantDiff(oldPlaces: dict, oldDefinitions: dict, newPlaces: dict, newDefinitions: dict):
+    plan = ReloadPlan()
+    plan.Types = {deviceType for deviceType in set(oldDefinitions) | set(newDefinitions)
+                  if oldDefinitions.get(deviceType) != newDefinitions.get(deviceType)}
+    for place in oldPlaces:
+        if place not in newPlaces:
+            plan.Removed += [f"{place}/{device}" for device in oldPlaces[place]]
+    for place, devicesDecl in newPlaces.items():
+        oldDevices = oldPlaces.get(place, {})
+        for device, deviceDecl in devicesDecl.items():
+            key = f"{place}/{device}"
+            oldDecl = oldDevices.get(device)
+            if oldDecl is None:
+                plan.Added.append(key)
+            elif oldDecl['type'] != deviceDecl['type'] or deviceDecl['type'] in plan.Types:
+                plan.Replaced.append(key)
+            elif oldDecl['address'] != deviceDecl['address']:
+                plan.Moved.append(key)
+            elif oldDecl != deviceDecl:
+                plan.Updated.append(key)
+            else:
+                continue
+            plan.Places.add(place)
+        for device in oldDevices:
+            if device not in devicesDecl:
+                plan.Removed.append(f"{place}/{device}")
+                plan.Places.add(place)
+    return plan
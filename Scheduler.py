@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+class Job:
+    __slots__ = ('due', 'interval', 'callback', 'Active', 'Owner')
+
+    def __init__(self, due: float, interval: float, callback):
+        self.due = due
+        self.interval = interval
+        self.callback = callback
+        self.Active = True
+        #Profile record the job's run time is added to
+        self.Owner = None
+
+    def Cancel(self):
+        self.Active = False
+
+
+class SimClock:
+    # Simulation time in seconds: real time, real time scaled by Scale, or stepped by Tick as fast as possible
+    MODES = ('real', 'scaled', 'step')
+
+    def __init__(self, mode: str = 'real', scale: float = 1.0, tick: float = 0.25):
+        self.Configure(mode, scale, tick)
+
+    def Configure(self, mode: str = 'real', scale: float = 1.0, tick: float = 0.25):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown clock mode {mode}, expected one of {', '.join(self.MODES)}")
+        self.Mode = mode
+        self.Scale = scale if mode == 'scaled' else 1.0
+        self.Tick = tick
+        self.origin = time.monotonic()
+        self.now = 0.0
+
+    def __call__(self):
+        if self.Mode == 'step':
+            return self.now
+        return (time.monotonic() - self.origin) * self.Scale
+
+    def Advance(self):
+        #Move stepped time on by one tick, real and scaled time move by themselves
+        if self.Mode == 'step':
+            self.now += self.Tick
+
+    @property
+    def TickDelay(self):
+        #Wall time to wait between ticks so each tick covers Tick simulated seconds
+        if self.Mode == 'step':
+            return 0
+        return self.Tick / self.Scale
+
+
+class TickMonitor:
+    # Tick cost against the fixed tick period, a tick overruns when it ends after its deadline
+    def __init__(self, window: int = 40):
+        self.Ticks = 0
+        self.Overruns = 0
+        self.Last = 0.0
+        self.Max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def Record(self, duration: float, overrun: bool):
+        self.Ticks += 1
+        self.Overruns += overrun
+        self.Last = duration
+        self.Max = max(self.Max, duration)
+        self.recent.append(overrun)
+
+    @property
+    def Load(self):
+        #Share of overrunning ticks in the recent window, None until the window has filled
+        if len(self.recent) < self.recent.maxlen:
+            return None
+        return sum(self.recent) / len(self.recent)
+
+    def Settle(self):
+        #Start a new window after the tick work changed
+        self.recent.clear()
+
+
+class Scheduler:
+    # Timer heap keyed by next due time, all due jobs are dispatched once per simulation tick
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+
+    def Now(self):
+        return self.clock()
+
+    def Push(self, job: Job):
+        heapq.heappush(self.heap, (job.due, next(self.counter), job))
+        return job
+
+    def After(self, delay: float, callback):
+        return self.Push(Job(self.clock() + delay, 0, callback))
+
+    def Every(self, interval: float, callback, delay: float = 0):
+        return self.Push(Job(self.clock() + delay, interval, callback))
+
+    def RunDue(self):
+        now = self.clock()
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            job = heapq.heappop(heap)[2]
+            if not job.Active:
+                continue
+            if job.interval:
+                #Skip missed periods instead of bursting to catch up
+                job.due += job.interval
+                if job.due <= now:
+                    job.due = now + job.interval
+                self.Push(job)
+            else:
+                job.Active = False
+            owner = job.Owner
+            try:
+                if owner is None:
+                    job.callback()
+                else:
+                    mark = owner.Mark()
+                    start = time.perf_counter()
+                    job.callback()
+                    owner.AddJob(time.perf_counter() - start, mark)
+            except Exception as e:
+                print(f"Error of Job: {e}")
+                if owner is not None:
+                    owner.Error(e)
+
+    def __len__(self):
+        return len(self.heap)
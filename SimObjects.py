@@ -1,224 +1,252 @@
-import asyncio
-import random
 import math
 import sys
+from Registry import Simulates
 
-class SimObj_MotorVSD:
-    def __init__(self, device):
+class CommandDecoder:
+    # Compares the control word with the previous one so held command bits act only once
+    def __init__(self, word: int = 0):
+        self.word = word
+        self.rising = 0
+        self.falling = 0
+
+    def Decode(self, word: int):
+        changed = word ^ self.word
+        self.word = word
+        self.rising = word & changed
+        self.falling = ~word & changed
+        return changed
+
+    def Rising(self, bit: int):
+        return (self.rising >> bit) & 1
+
+    def Falling(self, bit: int):
+        return (self.falling >> bit) & 1
+
+class SimObj:
+    #Simulators only re-evaluate when their registers changed, periodic work runs as scheduler jobs
+    EventDriven = True
+
+    def __init__(self, device, scheduler, noise):
         self.device = device
         self.simScale = device.SimScale
+        self.scheduler = scheduler
+        self.noise = noise
+        self.jobs = []
+        self.channels = []
+        #Unscaled amplitude and simScale power of each noise channel, re-applied by SetScale
+        self.scaled = []
+        #Seeded with the current word, bits already held when the simulator (re)starts are not new commands
+        self.commands = CommandDecoder(device.Control01.Value if device.Control01 else 0)
+        self.Profile = None
+
+    def simulate(self):
+        pass
+
+    def Restore(self):
+        pass
+
+    def Rising(self, bit):
+        return self.commands.Rising(bit)
+
+    def Falling(self, bit):
+        return self.commands.Falling(bit)
+
+    def Behave(self, table):
+        #Apply the devices.json behaviour table to this pass's command edges
+        commands = self.commands
+        if table is None or not (commands.rising or commands.falling):
+            return
+        status01, status02 = self.device.Status01, self.device.Status02
+        words = [status01.Value if status01 else 0, status02.Value if status02 else 0]
+        table.Evaluate(commands.rising, commands.falling, words)
+        if status01:
+            status01.Value = words[0]
+        if status02:
+            status02.Value = words[1]
+
+    def Track(self, job):
+        self.jobs = [j for j in self.jobs if j.Active]
+        self.jobs.append(job)
+        if self.Profile:
+            self.Profile.JobsCreated += 1
+            job.Owner = self.Profile
+        return job
+
+    def Every(self, interval, callback, delay=0):
+        return self.Track(self.scheduler.Every(interval, callback, delay))
+
+    def After(self, delay, callback):
+        return self.Track(self.scheduler.After(delay, callback))
+
+    def Keep(self, job, active, interval, callback):
+        #Keep a periodic job scheduled while active holds, cancel it otherwise
+        if active:
+            if job is None or not job.Active:
+                job = self.Every(interval, callback)
+        elif job is not None:
+            job.Cancel()
+            job = None
+        return job
+
+    def Noise(self, tag, base, amplitude, active=True, scaled=0):
+        #Register a tag with the plant wide noise stage, it is written as base +/- amplitude * simScale**scaled
+        channel = self.noise.Add(self.device.Image.bank, tag, base, amplitude * self.simScale**scaled, active, f"{self.device.Key}/{len(self.channels)}")
+        self.channels.append(channel)
+        self.scaled.append((amplitude, scaled))
+        return channel
+
+    def SetScale(self, simScale):
+        #Live SimScale change, scaled noise amplitudes follow, other simulators read simScale on each pass
+        self.simScale = simScale
+        for channel, (amplitude, scaled) in zip(self.channels, self.scaled):
+            if scaled:
+                self.noise.Set(channel, amplitude=amplitude * simScale**scaled)
+
+    def Cancel(self, job):
+        if job is not None:
+            job.Cancel()
+        return None
+
+    def Settle(self):
+        #Finish pending one shot jobs now, a simulator restarted on a reload starts from steady status bits
+        for job in self.jobs:
+            if job.Active and not job.interval:
+                job.Cancel()
+                job.callback()
+
+    def Stop(self):
+        for job in self.jobs:
+            job.Cancel()
+        self.jobs = []
+        for channel in self.channels:
+            self.noise.Remove(channel)
+        self.channels = []
+        self.scaled = []
+
+@Simulates('Motor-VSD')
+class SimObj_MotorVSD(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.running_status = None
-        self.update_values_task = None
-        self.update_busV_task = None
         self.ref_Values = [0]*len(self.device.Analog)
         for i in range(1,len(self.device.Analog)):
             self.ref_Values[i] = self.device.Analog[i].Value
+        # Speed and running values only vary while the motor runs
+        last = len(self.device.Analog)-1
+        self.running_noise = [self.Noise(self.device.Analog[0], self.ref_Values[1], 0.1, False)]
+        for i in range(2,last):
+            if self.ref_Values[i] > 0:
+                self.running_noise.append(self.Noise(self.device.Analog[i], self.ref_Values[i], self.ref_Values[i], False, scaled=1))
+        # Bus Voltage
+        if self.ref_Values[last] > 0:
+            self.Noise(self.device.Analog[last], self.ref_Values[last], self.ref_Values[last], scaled=1)
 
-    async def simulate(self):
+    def simulate(self):
         # Run Command
-        if self.device.Control01.GetBit(0) == 1:
+        if self.Rising(0):
             self.ref_Values[1] = self.device.Analog[1].Value
             self.device.Status01.SetBit(0,1)
             self.running_status = True
         # Stop Command
-        if self.device.Control01.GetBit(1) == 1:
+        if self.Rising(1):
             self.device.Status01.SetBit(0,0)
         # Reset Fault
-        if self.device.Control01.GetBit(2) == 1:
+        if self.Rising(2):
             self.device.Status01.SetArray(0,2,0b000)
         # Set Speed
-        if self.device.Control01.GetBit(3) == 1:
+        if self.Rising(3):
             self.ref_Values[1] = self.device.Analog[1].Value
-        # PID Control ON
-        if self.device.Control01.GetBit(5) == 1:
-            self.device.Status02.SetArray(8,10,0b001)
-        # PID Control OFF
-        if self.device.Control01.GetBit(6) == 1:
-            self.device.Status02.SetArray(8,10,0b100)
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
         #Scheduler Run
-        if self.device.Control01.GetBit(14) == 1:
+        if self.Rising(14):
             self.ref_Values[1] = self.device.Analog[1].Value
             self.device.Status01.SetBit(0,1)
             self.running_status = True
         #Scheduler Stop
-        if self.device.Control01.GetBit(15) == 1:
+        if self.Rising(15):
             self.device.Status01.SetBit(0,0)
             self.running_status = False
         # Simulate Running Status
-        if self.device.Status01.GetBit(0) == 1 and self.ref_Values[1] > 0:
-            if self.update_values_task is None or self.update_values_task.done():
-                self.update_values_task = asyncio.create_task(self.update_values())
+        running = self.device.Status01.GetBit(0) == 1 and self.ref_Values[1] > 0
+        self.noise.Set(self.running_noise[0], self.ref_Values[1])
+        self.noise.Enable(self.running_noise, running)
         # Simulate Stopped Status
         if self.device.Status01.GetBit(0) == 0 and self.running_status == True:
             self.device.Analog[0].Value = 0
             self.Restore()
             self.running_status = False
-        #Simulate Bus Voltage
-        if self.update_busV_task is None or self.update_busV_task.done():
-            self.update_busV_task = asyncio.create_task(self.update_busV())
         
     def Restore(self):
         for i in range(2,len(self.device.Analog)):
             self.device.Analog[i].Value = self.ref_Values[i]
 
-    async def update_values(self):
-        self.device.Analog[0].Value = self.ref_Values[1] + random.uniform(-0.1,0.1)
-        for i in range(2,len(self.device.Analog)-1):
-            if self.ref_Values[i] > 0:
-                self.device.Analog[i].Value = self.ref_Values[i] + self.ref_Values[i]*random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
-        
-    async def update_busV(self):
-        if self.ref_Values[len(self.device.Analog)-1] > 0:
-            self.device.Analog[len(self.device.Analog)-1].Value = self.ref_Values[len(self.device.Analog)-1] + self.ref_Values[len(self.device.Analog)-1]*random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
-        
-
-class SimObj_MotorNormal:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
 
-    async def simulate(self):
-        # Run Command
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status01.SetBit(0,1)
-        # Stop Command
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status01.SetBit(0,0)
-        # Reset Fault
-        if self.device.Control01.GetBit(2) == 1:
-            self.device.Status01.SetArray(0,2,0b000)
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
-        #Scheduler Run
-        if self.device.Control01.GetBit(14) == 1:
-            self.device.Status01.SetBit(0,1)
-        #Scheduler Stop
-        if self.device.Control01.GetBit(15) == 1:
-            self.device.Status01.SetBit(0,0)
-            self.running_status = False
-            
-    def Restore(self):
-        pass
-    
-    
-class SimObj_ValveMOV:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-        self.valve_open_task = None
-        self.valve_close_task = None
+@Simulates('Valve-MOV')
+class SimObj_ValveMOV(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
+        self.valve_open_job = None
+        self.valve_close_job = None
 
-    async def simulate(self):
+    def simulate(self):
         # Open Command
-        if self.device.Control01.GetBit(0) == 1 and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(0) and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.open_command()
         # Close Command
-        if self.device.Control01.GetBit(1) == 1 and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(1) and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.close_command()
         # Stop Command
-        if self.device.Control01.GetBit(2) == 1 and self.device.Status01.GetArray(2,3) != 0b00:
+        if self.Rising(2) and self.device.Status01.GetArray(2,3) != 0b00:
             self.device.Status01.SetArray(2,3,0b00)
-            if self.valve_open_task:
-                self.valve_open_task.cancel()
-                self.valve_open_task = None
-            if self.valve_close_task:
-                self.valve_close_task.cancel()
-                self.valve_close_task = None
+            self.valve_open_job = self.Cancel(self.valve_open_job)
+            self.valve_close_job = self.Cancel(self.valve_close_job)
         # Reset Fault
-        if self.device.Control01.GetBit(3) == 1:
+        if self.Rising(3):
             self.device.Status01.SetArray(4,5,0b00)
             if self.device.Status01.GetBit(0) == 0:
                 self.close_command()
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
         #Scheduler Open
-        if self.device.Control01.GetBit(14) == 1 and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(14) and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.open_command()
         #Scheduler Close
-        if self.device.Control01.GetBit(15) == 1 and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(15) and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.close_command()
             
     def Restore(self):
         pass
     
     def open_command(self):
-        if self.valve_open_task is None or self.valve_open_task.done():
-            self.valve_open_task = asyncio.create_task(self.valve_open())
+        if self.valve_open_job is None or not self.valve_open_job.Active:
+            self.device.Status01.SetBit(0,0)
+            self.device.Status01.SetArray(2,3,0b10)
+            self.valve_open_job = self.After(5, self.valve_opened)
             
     def close_command(self):
-        if self.valve_close_task is None or self.valve_close_task.done():
-            self.valve_close_task = asyncio.create_task(self.valve_close())
+        if self.valve_close_job is None or not self.valve_close_job.Active:
+            self.device.Status01.SetBit(1,0)
+            self.device.Status01.SetArray(2,3,0b01)
+            self.valve_close_job = self.After(5, self.valve_closed)
     
-    async def valve_open(self):
-        self.device.Status01.SetBit(0,0)
-        self.device.Status01.SetArray(2,3,0b10)
-        await asyncio.sleep(5)
+    def valve_opened(self):
         self.device.Status01.SetBit(3,0)
         self.device.Status01.SetArray(0,1,0b10)
     
-    async def valve_close(self):
-        self.device.Status01.SetBit(1,0)
-        self.device.Status01.SetArray(2,3,0b01)
-        await asyncio.sleep(5)
+    def valve_closed(self):
         self.device.Status01.SetBit(2,0)
         self.device.Status01.SetArray(0,1,0b01)
         
-class SimObj_ValveModulating:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-        self.valve_set_angle_task = None
+@Simulates('Valve-Modulating')
+class SimObj_ValveModulating(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
+        self.valve_set_angle_job = None
 
-    async def simulate(self):
+    def simulate(self):
         # Open Command
-        if self.device.Control01.GetBit(0) == 1 and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(0) and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.device.Analog[0].Value = 100
             self.set_angle_command()
         # Close Command
-        if self.device.Control01.GetBit(1) == 1 and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(1) and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.device.Analog[0].Value = 0
             self.set_angle_command()
         # Fully Open Signal
@@ -232,43 +260,24 @@ class SimObj_ValveModulating:
         else:
             self.device.Status01.SetBit(0,0)
         # Stop Command
-        if self.device.Control01.GetBit(2) == 1 and self.device.Status01.GetArray(2,3) != 0b00:
+        if self.Rising(2) and self.device.Status01.GetArray(2,3) != 0b00:
             self.device.Status01.SetBit(3,0)
-            if self.valve_set_angle_task:
-                self.valve_set_angle_task.cancel()
-                self.valve_set_angle_task = None
+            self.valve_set_angle_job = self.Cancel(self.valve_set_angle_job)
         # Reset Fault
-        if self.device.Control01.GetBit(3) == 1:
+        if self.Rising(3):
             self.device.Status01.SetBit(4,0)
-            if self.valve_set_angle_task:
-                self.valve_set_angle_task.cancel()
-                self.valve_set_angle_task = None
+            self.valve_set_angle_job = self.Cancel(self.valve_set_angle_job)
             self.device.Analog[0].Value = 0
             self.set_angle_command()
         # Set Ref Angle
-        if self.device.Control01.GetBit(4) == 1:
+        if self.Rising(4):
             self.set_angle_command()
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
         #Scheduler Open
-        if self.device.Control01.GetBit(14) == 1 and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(14) and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.device.Analog[0].Value = 100
             self.set_angle_command()
         #Scheduler Close
-        if self.device.Control01.GetBit(15) == 1 and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
+        if self.Rising(15) and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
             self.device.Analog[0].Value = 0
             self.set_angle_command()
             
@@ -276,79 +285,45 @@ class SimObj_ValveModulating:
         pass
             
     def set_angle_command(self):
-        if self.valve_set_angle_task is None or self.valve_set_angle_task.done():
-            self.valve_set_angle_task = asyncio.create_task(self.valve_set_angle())
+        if self.valve_set_angle_job is None or not self.valve_set_angle_job.Active:
+            self.end_angle = int(self.device.Analog[0].Value*10)
+            self.angle = int(self.device.Analog[1].Value*10)
+            self.device.Status01.SetBit(3,1)
+            if self.angle > self.end_angle:
+                self.step = -10
+            else:
+                self.step = 10
+            self.valve_set_angle_job = self.Every(1, self.valve_set_angle)
         
-    async def valve_set_angle(self):
-        end_angle = int(self.device.Analog[0].Value*10)
-        start_angle = int(self.device.Analog[1].Value*10)
-        self.device.Status01.SetBit(3,1)
-        if start_angle > end_angle:
-            step = -10
+    def valve_set_angle(self):
+        if (self.step > 0 and self.angle < self.end_angle) or (self.step < 0 and self.angle > self.end_angle):
+            self.device.Analog[1].Value = self.angle/10.0
+            self.angle += self.step
         else:
-            step = 10
-        for i in range(start_angle, end_angle, step):
-            self.device.Analog[1].Value = i/10.0
-            await asyncio.sleep(1)
-        self.device.Analog[1].Value = end_angle/10.0
-        self.device.Status01.SetBit(3,0)
-        
-class SimObj_ValveSolenoid:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-        
-    async def simulate(self):
-        # Open Command
-        if self.device.Control01.GetBit(0) == 1 and self.device.Status01.GetBit(1) == 0:
-            self.device.Status01.SetArray(0,1,0b10)
-        # Close Command
-        if self.device.Control01.GetBit(1) == 1 and self.device.Status01.GetBit(0) == 0:
-            self.device.Status01.SetArray(0,1,0b01)
-        # Reset Fault
-        if self.device.Control01.GetBit(3) == 1:
-            self.device.Status01.SetArray(4,5,0b00)
-            self.device.Status01.SetArray(0,1,0b01)
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
-        #Scheduler Open
-        if self.device.Control01.GetBit(14) == 1 and self.device.Status01.GetBit(1) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
-            self.device.Status01.SetArray(0,1,0b10)
-        #Scheduler Close
-        if self.device.Control01.GetBit(15) == 1 and self.device.Status01.GetBit(0) == 0 and self.device.Status01.GetArray(2,3) == 0b00:
-            self.device.Status01.SetArray(0,1,0b01)
-            
-    def Restore(self):
-        pass
-    
+            self.device.Analog[1].Value = self.end_angle/10.0
+            self.device.Status01.SetBit(3,0)
+            self.valve_set_angle_job = self.Cancel(self.valve_set_angle_job)
 
-class SimObj_SensorLevel:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+    def Settle(self):
+        #A travelling valve ends at its reference angle
+        if self.valve_set_angle_job is not None and self.valve_set_angle_job.Active:
+            self.angle = self.end_angle
+            self.valve_set_angle()
+        super().Settle()
+        
+@Simulates('Sensor-Level')
+class SimObj_SensorLevel(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.LevelRef = device.Analog[0].Value
         self.scale = 25
         self.counter = 0
         self.countForward = True
-        self.update_values_task = None
+        self.update_values_job = None
     
-    async def simulate(self):
-        # Set Level
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
+    def simulate(self):
+        # Set Level, tanks with linked pumps or valves are integrated by the engine's tank model
+        self.update_values_job = self.Keep(self.update_values_job, not self.device.Inflows, 2, self.update_values)
         # Set LL
         if self.device.Analog[0].Value > self.device.Settings[0].Value:
             self.device.Status01.SetBit(0,1)
@@ -373,7 +348,7 @@ class SimObj_SensorLevel:
     def Restore(self):
         self.device.Analog[0].Value = self.LevelRef
             
-    async def update_values(self):
+    def update_values(self):
         if self.countForward:
             self.counter += 1
         else:
@@ -385,62 +360,50 @@ class SimObj_SensorLevel:
             self.countForward = True
             
         self.device.Analog[0].Value = self.LevelRef + self.LevelRef*self.simScale * float(self.counter/self.scale)
-        await asyncio.sleep(2)
         
         
-class SimObj_SensorTotalizing:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('Sensor-Totalizing')
+class SimObj_SensorTotalizing(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.valueRef = device.Analog[0].Value
         self.totRef = device.Analog[1].Value
-        self.update_values_task = None
-        
-    async def simulate(self):
         # Set Value
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
+        self.Noise(self.device.Analog[0], self.valueRef, self.valueRef, scaled=2)
+        # Totalize
+        self.Every(2, self.update_values)
             
     def Restore(self):
         self.device.Analog[0].Value = self.valueRef
         self.device.Analog[1].Value = self.totRef
     
-    async def update_values(self): 
-        self.device.Analog[0].Value = self.valueRef + self.valueRef*self.simScale * random.uniform(-self.simScale,self.simScale)
+    def update_values(self):
         self.device.Analog[1].Value = self.device.Analog[1].Value + int(self.device.Analog[0].Value/36)
-        await asyncio.sleep(2)
         
         
-class SimObj_SensorAnalog:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('Sensor-Analog')
+class SimObj_SensorAnalog(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.valueRef = device.Analog[0].Value
-        self.update_values_task = None
-        
-    async def simulate(self):
         # Set Value
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
+        self.Noise(self.device.Analog[0], self.valueRef, self.valueRef, scaled=2)
             
     def Restore(self):
         self.device.Analog[0].Value = self.valueRef
-    
-    async def update_values(self):
-        self.device.Analog[0].Value = self.valueRef + self.valueRef*self.simScale * random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
         
 
-class SimObj_PIDControl:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('PID Control')
+class SimObj_PIDControl(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.pv = device.Analog[0].Value
         self.sp = device.Analog[1].Value
         self.out = device.Analog[2].Value
-        self.update_values_task = None
+        self.pv_noise = self.Noise(self.device.Analog[0], self.sp, self.sp*0.1, False)
+        self.out_noise = self.Noise(self.device.Analog[2], 50, 25, False)
         
-    async def simulate(self):
+    def simulate(self):
         # Set Active Setpoint
         if self.device.Status01.GetBit(13) == 1:
             self.device.Analog[1].Value = self.device.Settings[0].Value
@@ -450,126 +413,86 @@ class SimObj_PIDControl:
             self.device.Analog[1].Value = self.device.Settings[2].Value
 
         # Set Value
-        if self.device.Status01.GetBit(0) == 1:
-            if self.update_values_task is None or self.update_values_task.done():
-                self.update_values_task = asyncio.create_task(self.update_values())
-        else:
+        running = self.device.Status01.GetBit(0) == 1
+        self.noise.Set(self.pv_noise, self.device.Analog[1].Value, self.device.Analog[1].Value*0.1)
+        self.noise.Enable([self.pv_noise, self.out_noise], running)
+        if not running:
             self.device.Analog[0].Value = 0
             self.device.Analog[2].Value = 0
-            await asyncio.sleep(1)
                 
     def Restore(self):
         self.device.Analog[0].Value = self.pv
         self.device.Analog[1].Value = self.sp
         self.device.Analog[2].Value = self.out
-
-    async def update_values(self):
-        self.device.Analog[0].Value = self.device.Analog[1].Value + self.device.Analog[1].Value * random.uniform(-0.1,0.1)
-        self.device.Analog[2].Value = random.uniform(25,75)
-        await asyncio.sleep(2)
         
         
-class SimObj_DPA:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('DPA')
+class SimObj_DPA(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.values = [0]*len(self.device.Analog)
         for i in range(len(self.device.Analog)):
             self.values[i] = self.device.Analog[i].Value
-        self.update_values_task = None
-        
-    async def simulate(self):
         # Set Value
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
+        for i in range(len(self.device.Analog)):
+            if self.values[i] > 0 and i != 18 and i != 19:
+                self.Noise(self.device.Analog[i], self.values[i], self.values[i], scaled=1)
+        self.Every(2, self.update_values)
             
     def Restore(self):
         for i in range(len(self.device.Analog)):
             self.device.Analog[i].Value = self.values[i]
     
-    async def update_values(self):
-        for i in range(len(self.device.Analog)):
-            if self.values[i] > 0:
-                if i == 18 or i == 19:
-                    self.device.Analog[i].Value = self.device.Analog[i].Value + 1
-                else:
-                    self.device.Analog[i].Value = self.values[i] + self.values[i]*random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
+    def update_values(self):
+        for i in (18, 19):
+            if i < len(self.device.Analog) and self.values[i] > 0:
+                self.device.Analog[i].Value = self.device.Analog[i].Value + 1
         
-class SimObj_Generator:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('GEN Power')
+class SimObj_Generator(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.startSimAt = 3
         self.values = [0]*(len(self.device.Analog))
         for i in range(len(self.device.Analog)):
             self.values[i] = self.device.Analog[i].Value
-        self.update_values_task = None
-        
-    async def simulate(self):
         # Set Gen Values
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
-        # Run Command
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status01.SetBit(6,1)
-        # Stop Command
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status01.SetBit(6,0)
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
+        for i in range(self.startSimAt,len(self.device.Analog)):
+            if self.values[i] > 0 and i != 9:
+                self.Noise(self.device.Analog[i], self.values[i], self.values[i], scaled=1)
+        self.Every(2, self.update_values)
             
     def Restore(self):
         for i in range(self.startSimAt,len(self.device.Analog)):
             self.device.Analog[i].Value = self.values[i]
     
-    async def update_values(self):
-        for i in range(self.startSimAt,len(self.device.Analog)):
-            if self.values[i] > 0:
-                if i == 9:
-                    self.device.Analog[i].Value = self.device.Analog[i].Value + 1
-                else:
-                    self.device.Analog[i].Value = self.values[i] + self.values[i]*random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
+    def update_values(self):
+        if 9 < len(self.device.Analog) and self.values[9] > 0:
+            self.device.Analog[9].Value = self.device.Analog[9].Value + 1
         
-class SimObj_UPS:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('UPS Power')
+class SimObj_UPS(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         self.values = [0]*len(self.device.Analog)
         for i in range(len(self.device.Analog)):
             self.values[i] = self.device.Analog[i].Value
-        self.update_values_task = None
-        
-    async def simulate(self):
         # Set Value
-        if self.update_values_task is None or self.update_values_task.done():
-            self.update_values_task = asyncio.create_task(self.update_values())
+        for i in range(len(self.device.Analog)):
+            if self.values[i] > 0:
+                self.Noise(self.device.Analog[i], self.values[i], self.values[i], scaled=1)
             
     def Restore(self):
         for i in range(len(self.device.Analog)):
             self.device.Analog[i].Value = self.values[i]
-    
-    async def update_values(self):
-        for i in range(len(self.device.Analog)):
-            if self.values[i] > 0:
-                self.device.Analog[i].Value = self.values[i] + self.values[i]*random.uniform(-self.simScale,self.simScale)
-        await asyncio.sleep(2)
         
-class SimObj_RSF:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-        self.backwash_task = None
-        self.filtering_task = None
-        self.standby_task = None
+@Simulates('RSF')
+class SimObj_RSF(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
+        self.backwash_job = None
+        self.filtering_job = None
+        self.standby_job = None
         self.filteringCounter = 0
         self.standbyCounter = 0
         self.backwashCounter = 0
@@ -582,83 +505,38 @@ class SimObj_RSF:
         self.waitTime = self.device.Settings[5]
         self.totalBackwashTime = self.drawdownTime + self.airTime + self.airWaterTime + self.waterTime
         
-    async def simulate(self):
-        #Startup
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status01.SetArray(0,1,0b01)
-            self.device.Status01.SetBit(6,0)
-        #Shutdown
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status01.SetArray(0,1,0b00)
-            self.device.Status01.SetBit(6,1)
+    def simulate(self):
         #Start Backwash
-        if self.device.Control01.GetBit(2) == 1:
-            if self.backwash_task is None or self.backwash_task.done():
-                self.backwash_task = asyncio.create_task(self.backwash())
+        if self.Rising(2):
+            if self.backwash_job is None or not self.backwash_job.Active:
+                self.start_backwash()
         #Pause Backwash
-        if self.device.Control01.GetBit(3) == 1 and self.device.Status01.GetBit(1) == 1:
+        if self.Rising(3) and self.device.Status01.GetBit(1) == 1:
             self.pauseBackwash = True
             self.device.Status01.SetBit(7,1)
         #Resume Backwash
-        if self.device.Control01.GetBit(4) == 1 and self.device.Status01.GetBit(1) == 1:
+        if self.Rising(4) and self.device.Status01.GetBit(1) == 1:
             self.pauseBackwash = False
             self.device.Status01.SetBit(7,0)
         #Reset Backwash
-        if self.device.Control01.GetBit(5) == 1 and self.device.Status01.GetBit(1) == 1:
+        if self.Rising(5) and self.device.Status01.GetBit(1) == 1:
             self.pauseBackwash = False
             self.device.Status01.SetBit(7,0)
             self.backwashCounter = 0
             self.device.Status01.SetArray(2,6,0b00000)
-        #Set Auto
-        if self.device.Control01.GetBit(6) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-            self.device.Status02.SetArray(5,6,0b00)
-        #Set SCADA Semi Auto
-        if (self.device.Control01.GetBit(7) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b000)
-            self.device.Status02.SetArray(5,6,0b01)
-        #Set HMI Semi Auto
-        if (self.device.Control01.GetBit(7) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b000)
-            self.device.Status02.SetArray(5,6,0b10)
-        #Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-            self.device.Status02.SetArray(5,6,0b00)
-        #Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-            self.device.Status02.SetArray(5,6,0b00)
-        #set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        #set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
-        #Set Time Mode
-        if self.device.Control01.GetBit(11) == 1:
-            self.device.Status02.SetArray(8,10,0b001)
-        #Set Level Mode
-        if self.device.Control01.GetBit(12) == 1:
-            self.device.Status02.SetArray(8,10,0b010)
-        #Set Pressure Mode
-        if self.device.Control01.GetBit(13) == 1:
-            self.device.Status02.SetArray(8,10,0b100)
         #Filtering Mode
-        if self.device.Status01.GetBit(0) == 1:
-            if self.filtering_task is None or self.filtering_task.done():
-                self.filtering_task = asyncio.create_task(self.filtering())
+        filtering = self.device.Status01.GetBit(0) == 1
+        self.filtering_job = self.Keep(self.filtering_job, filtering, 1, self.filtering)
         #Standby Mode
-        if self.device.Status01.GetArray(0,1) == 0 and self.device.Status01.GetBit(6) == 1:
-            if self.standby_task is None or self.standby_task.done():
-                self.standby_task = asyncio.create_task(self.standby())
+        standby = self.device.Status01.GetArray(0,1) == 0 and self.device.Status01.GetBit(6) == 1
+        self.standby_job = self.Keep(self.standby_job, standby, 1, self.standby)
         #Reset Standby
         if self.device.Status01.GetBit(6) == 0:
             self.standbyCounter = 0
             self.device.Analog[6].Value = 0
         
                 
-    async def backwash(self):
+    def start_backwash(self):
         self.device.Status01.SetArray(0,1,0b10)
         self.drawdownTime = self.device.Settings[0].Value
         self.airTime = self.device.Settings[1].Value
@@ -666,7 +544,10 @@ class SimObj_RSF:
         self.waterTime = self.device.Settings[3].Value
         self.standbyTime = self.device.Settings[4].Value
         self.totalBackwashTime = self.drawdownTime + self.airTime + self.airWaterTime + self.waterTime
-        while self.backwashCounter <= self.totalBackwashTime:
+        self.backwash_job = self.Every(1, self.backwash)
+
+    def backwash(self):
+        if self.backwashCounter <= self.totalBackwashTime:
             if self.backwashCounter <= self.drawdownTime:
                 self.device.Status01.SetArray(2,6,0b00001)
                 self.device.Analog[2].Value = self.backwashCounter
@@ -684,78 +565,55 @@ class SimObj_RSF:
                 self.device.Status01.SetArray(2,6,0b01000)
             if self.pauseBackwash == False:
                 self.backwashCounter += 1
-            await asyncio.sleep(1)
-        while self.backwashCounter <= self.totalBackwashTime + self.standbyTime:
+        elif self.backwashCounter <= self.totalBackwashTime + self.standbyTime:
             self.device.Status01.SetArray(2,6,0b10000)
             self.device.Analog[5].Value = 0
             self.device.Analog[6].Value = self.backwashCounter - self.totalBackwashTime
             self.backwashCounter += 1
-            await asyncio.sleep(1)
+        else:
+            self.end_backwash()
+
+    def end_backwash(self):
         self.device.Analog[6].Value = 0
         self.backwashCounter = 0
         self.filteringCounter = 0
         self.device.Status01.SetArray(0,1,0b01)
         self.device.Status01.SetBit(6,0)
+        self.backwash_job = self.Cancel(self.backwash_job)
+
+    def Settle(self):
+        #A running backwash ends and the filter goes back to filtering
+        if self.backwash_job is not None and self.backwash_job.Active:
+            for i in range(2,6):
+                self.device.Analog[i].Value = 0
+            self.device.Status01.SetArray(2,6,0b00000)
+            self.device.Status01.SetBit(7,0)
+            self.pauseBackwash = False
+            self.end_backwash()
+        super().Settle()
         
-    async def filtering(self):
+    def filtering(self):
         self.device.Analog[7].Value = self.filteringCounter
         self.device.Analog[8].Value = self.waitTime.Value - self.filteringCounter
         if self.filteringCounter < self.waitTime.Value:
             self.filteringCounter += 1
-        await asyncio.sleep(1)
         
-    async def standby(self):
+    def standby(self):
         self.device.Analog[6].Value = self.standbyCounter
         if self.standbyCounter < 65000:
             self.standbyCounter += 1
-        await asyncio.sleep(1)
         
     def Restore(self):
         for i in range(len(self.device.Analog)):
             self.device.Analog[i].Value = 0
             
-class SimObj_ScreenPackage:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
+@Simulates('Screen Package')
+class SimObj_ScreenPackage(SimObj):
+    def __init__(self, device, scheduler, noise):
+        super().__init__(device, scheduler, noise)
         
-    async def simulate(self):
-        # SV 1 Open Command
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status01.SetArray(3,4,0b01)
-        # SV 1 Close Command
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status01.SetArray(3,4,0b10)
-        # SV 2 Open Command
-        if self.device.Control01.GetBit(2) == 1:
-            self.device.Status01.SetArray(9,10,0b01)
-        # SV 2 Close Command
-        if self.device.Control01.GetBit(3) == 1:
-            self.device.Status01.SetArray(9,10,0b10)
-        # Reset Fault
-        if self.device.Control01.GetBit(4) == 1:
-            self.device.Status01.SetBit(2,0)
-            self.device.Status01.SetBit(5,0)
-            self.device.Status01.SetBit(8,0)
-            self.device.Status01.SetBit(11,0)
-            self.device.Status01.SetArray(3,4,0b10)
-            self.device.Status01.SetArray(9,10,0b10)
-        # Set Auto
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(8) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-        # Set Out of Service
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetBit(15,1)
-        # Set In Service
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status01.SetBit(15,0)
-        #SV 1 Scheduler Open
+    def simulate(self):
+        #SV 1 Scheduler Open, follows the held scheduler bit while in Auto
         if self.device.Control01.GetBit(14) == 1 and self.device.Status02.GetBit(0) == 1:
             self.device.Status01.SetArray(3,4,0b01)
         #SV 1 Scheduler Open
@@ -771,74 +629,3 @@ class SimObj_ScreenPackage:
     def Restore(self):
         pass
     
-class SimObj_Root:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-    
-    async def simulate(self):
-        # Set SCADA Active
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status02.SetBit(1,1)
-            self.device.Status02.SetBit(6,0)
-        # Set HMI Active
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status02.SetBit(1,0)
-            self.device.Status02.SetBit(6,1)
-        
-    def Restore(self):
-        pass
-    
-class SimObj_VentilationFans:
-    def __init__(self, device):
-        self.device = device
-        self.simScale = device.SimScale
-        
-    async def simulate(self):
-        # Fan12 Run Command
-        if self.device.Control01.GetBit(0) == 1:
-            self.device.Status01.SetBit(0,1)
-            self.device.Status01.SetBit(2,1)
-        # Fan12 Stop Command
-        if self.device.Control01.GetBit(1) == 1:
-            self.device.Status01.SetBit(0,0)
-            self.device.Status01.SetBit(2,0)
-        # Fan34 Run Command
-        if self.device.Control01.GetBit(2) == 1:
-            self.device.Status01.SetBit(4,1)
-            self.device.Status01.SetBit(6,1)
-        # Fan34 Stop Command
-        if self.device.Control01.GetBit(3) == 1:
-            self.device.Status01.SetBit(4,0)
-            self.device.Status01.SetBit(6,0)
-        # Fan56 Run Command
-        if self.device.Control01.GetBit(4) == 1:
-            self.device.Status01.SetBit(8,1)
-            self.device.Status01.SetBit(10,1)
-        # Fan56 Stop Command
-        if self.device.Control01.GetBit(5) == 1:
-            self.device.Status01.SetBit(8,0)
-            self.device.Status01.SetBit(10,0)
-        # Fan78 Run Command
-        if self.device.Control01.GetBit(6) == 1:
-            self.device.Status01.SetBit(12,1)
-            self.device.Status01.SetBit(14,1)
-        # Fan78 Stop Command
-        if self.device.Control01.GetBit(7) == 1:
-            self.device.Status01.SetBit(12,0)
-            self.device.Status01.SetBit(14,0)
-        # Reset Fault
-        if self.device.Control01.GetBit(9) == 1:
-            self.device.Status01.SetArray(0,11,0b000000000000)
-        # Set Auto
-        if self.device.Control01.GetBit(10) == 1:
-            self.device.Status02.SetArray(0,2,0b001)
-        # Set SCADA Manual
-        if (self.device.Control01.GetBit(11) == 1) and (self.device.Status02.GetBit(11) == 1):
-            self.device.Status02.SetArray(0,2,0b010)
-        # Set HMI Manual
-        if (self.device.Control01.GetBit(11) == 1) and (self.device.Status02.GetBit(11) == 0):
-            self.device.Status02.SetArray(0,2,0b100)
-            
-    def Restore(self):
-        pass
\ No newline at end of file
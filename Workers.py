@@ -0,0 +1,132 @@
+import multiprocessing
+import queue
+import time
+from functools import partial
+
+
+def Partition(placesDecl: dict, count: int):
+    # Places spread over the workers by device count, each place goes to the least loaded worker
+    shares = [[] for worker in range(count)]
+    loads = [0] * count
+    for place in sorted(placesDecl, key=lambda place: len(placesDecl[place]), reverse=True):
+        worker = loads.index(min(loads))
+        shares[worker].append(place)
+        loads[worker] += len(placesDecl[place])
+    return [share for share in shares if share]
+
+
+def Run(commands, results, config: dict):
+    # Worker process: rebuilds its places on the shared banks and simulates the devices it is sent
+    import Nuwans_ModBus_Sim2_v001 as App
+    from Registry import Registry
+    Registry.Discover(config["Plugins"])
+    plant = App.Plant(config["Places"], config["Definitions"], config["UnitIDs"], config["Banks"], lazy=True)
+    engine = App.SimEngine()
+    engine.noise.Seed = config["Seed"]
+    engine.clock.Configure(*config["Clock"])
+    engine.adaptive = config["Adaptive"]
+    nextTick = time.monotonic()
+    while True:
+        try:
+            command, *args = commands.get(timeout=max(0, nextTick - time.monotonic()))
+        except queue.Empty:
+            command = None
+        if command == 'stop':
+            break
+        if command == 'stats':
+            results.put(engine.profiler.Stats())
+        elif command is not None:
+            device = plant.GetDevice(args[0])
+            if command == 'add':
+                device.SimScale = args[1]
+                engine.add_simulator(device)
+            elif command == 'remove':
+                engine.remove_simulator(device)
+            elif command == 'scale':
+                engine.set_sim_scale(device, args[1])
+            elif command == 'wake' and device.Simulator:
+                device.Simulator.Wake(args[1])
+        #A steady stream of commands never holds back an overdue tick
+        if time.monotonic() >= nextTick:
+            start = time.monotonic()
+            engine.step()
+            now = time.monotonic()
+            nextTick += engine.clock.TickDelay
+            engine.ticks.Record(now - start, engine.clock.TickDelay > 0 and now > nextTick)
+            if engine.adaptive:
+                engine.adapt()
+            nextTick = max(nextTick, now)
+
+
+class WorkerPool:
+    # Places partitioned over simulation processes that write into the plant's shared register banks.
+    # The server process keeps serving the banks and forwards simulate requests and client writes
+    # to any register of a device, settings and analog values included, to the worker owning it
+    def __init__(self, plant, definitions: dict, count: int, config: dict):
+        self.plant = plant
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = []
+        self.owners = {}
+        self.results = self.context.Queue()
+        plant.Share()
+        for places in Partition(plant.PlacesDecl, count):
+            commands = self.context.Queue()
+            workerConfig = dict(config, Places={place: plant.PlacesDecl[place] for place in places},
+                                Definitions=definitions, UnitIDs=plant.UnitIDs, Banks=plant.Banks)
+            process = self.context.Process(target=Run, args=(commands, self.results, workerConfig), daemon=True)
+            process.start()
+            self.processes.append((process, commands))
+            for place in places:
+                self.owners[place] = commands
+
+    def Owner(self, device):
+        return self.owners.get(device.Key.split('/', 1)[0])
+
+    @staticmethod
+    def Watched(device):
+        #The device's register span plus a Status02 shared through a link
+        image = device.Image
+        addresses = set(range(image.address, image.address + image.count))
+        for vector in (device.Status01, device.Status02, device.Control01):
+            if vector:
+                addresses.add(vector.Address)
+        return addresses
+
+    def Add(self, device):
+        self.Owner(device).put(('add', device.Key, device.SimScale))
+        #One callback for the device, a write over several of its registers wakes it once
+        wake = partial(self.Wake, device)
+        for address in self.Watched(device):
+            device.Image.AddWriteHook(address, wake)
+
+    def Remove(self, device):
+        for address in self.Watched(device):
+            device.Image.RemoveWriteHook(address)
+        self.Owner(device).put(('remove', device.Key))
+
+    def Scale(self, device):
+        self.Owner(device).put(('scale', device.Key, device.SimScale))
+
+    def Wake(self, device, address: int = None):
+        self.Owner(device).put(('wake', device.Key, address))
+
+    def Stats(self, timeout: float = 1):
+        stats = []
+        for process, commands in self.processes:
+            commands.put(('stats',))
+        for process in self.processes:
+            try:
+                stats += self.results.get(timeout=timeout)
+            except queue.Empty:
+                break
+        return stats
+
+    def Stop(self):
+        for process, commands in self.processes:
+            commands.put(('stop',))
+        for process, commands in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.plant.Release()
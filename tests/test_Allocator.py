@@ -0,0 +1,119 @@
+from Allocator import AddressAllocator, UnitSpace, UnitOf
+
+
+def Gaps(space):
+    return [(start, space.gapEnds[start]) for start in space.gapStarts]
+
+
+def Space(ranges, size=100):
+    space = UnitSpace(size)
+    space.Build(ranges)
+    return space
+
+
+def test_build_sweeps_gaps_around_overlaps():
+    space = Space([(40, 50, 'c'), (10, 20, 'a'), (15, 30, 'b')])
+    assert space.keys == ['a', 'b', 'c']
+    assert Gaps(space) == [(0, 10), (30, 40), (50, 100)]
+    assert space.Overlaps(18, 19) == [0, 1]
+    assert space.Overlaps(30, 40) == []
+
+
+def test_take_splits_the_gap():
+    space = Space([])
+    space.Take(20, 30, 'a')
+    space.Take(0, 5, 'b')
+    assert Gaps(space) == [(5, 20), (30, 100)]
+    assert space.starts == [0, 20]
+    assert space.End() == 30
+
+
+def test_release_merges_with_neighbouring_gaps():
+    space = Space([(0, 10, 'a'), (10, 20, 'b'), (20, 30, 'c')])
+    space.Release(10, 'b')
+    assert Gaps(space) == [(10, 20), (30, 100)]
+    space.Release(20, 'c')
+    assert Gaps(space) == [(10, 100)]
+    space.Release(0, 'a')
+    assert Gaps(space) == [(0, 100)]
+    assert space.End() == 0
+
+
+def test_release_keeps_addresses_of_overlapping_ranges():
+    space = Space([(10, 30, 'a'), (15, 20, 'b'), (25, 40, 'c')])
+    space.Release(10, 'a')
+    assert Gaps(space) == [(0, 15), (20, 25), (40, 100)]
+
+
+def test_release_picks_the_key_among_equal_starts():
+    space = Space([(10, 20, 'a'), (10, 15, 'b')])
+    space.Release(10, 'a')
+    assert space.keys == ['b']
+    assert Gaps(space) == [(0, 10), (15, 100)]
+
+
+def test_best_fit_takes_the_smallest_then_lowest_gap():
+    space = Space([(5, 10, 'a'), (14, 20, 'b'), (24, 30, 'c')])
+    assert space.BestFit(4) == 10
+    assert space.BestFit(5) == 0
+    assert space.BestFit(6) == 30
+    assert space.BestFit(71) is None
+
+
+def test_first_fit_starts_inside_or_after_address():
+    space = Space([(5, 10, 'a'), (14, 20, 'b')])
+    assert space.FirstFit(0, 3) == 0
+    assert space.FirstFit(3, 3) == 10
+    assert space.FirstFit(11, 3) == 11
+    assert space.FirstFit(12, 3) == 20
+    assert space.FirstFit(7, 2) == 10
+    assert space.FirstFit(99, 2) is None
+
+
+def test_end_of_full_and_empty_spaces():
+    assert Space([]).End() == 0
+    assert Space([(90, 100, 'a')]).End() == 100
+    assert Space([(0, 100, 'a')]).End() == 100
+
+
+def test_unit_numbering():
+    assert UnitOf(None, 'Intake') == 0
+    assert UnitOf({'Intake': 3}, 'Intake') == 3
+    assert UnitOf({'Intake': 3}, 'Outlet') == 1
+
+
+DEFINITIONS = {'Pump': {'Registers': 10, 'Status02': True}, 'Sensor': {'Registers': 4, 'Status02': None}}
+
+
+def Decl(deviceType, address, link=None):
+    return {'type': deviceType, 'address': address, 'link': link}
+
+
+def test_load_reports_conflicts():
+    allocator = AddressAllocator({'A': 1, 'B': 1})
+    conflicts = allocator.Load({
+        'A': {'p1': Decl('Pump', 0), 'p2': Decl('Pump', 5), 's1': Decl('Sensor', 20, link='p1'), 'p3': Decl('Pump', 99, link='gone')},
+        'B': {'p4': Decl('Pump', 65530)},
+    }, DEFINITIONS)
+    assert any(conflict.startswith("A/p2 5-14 overlaps A/p1 0-9") for conflict in conflicts)
+    assert any("A/s1 links to p1 without a Status02" in conflict for conflict in conflicts)
+    assert any("A/p3 links to missing device gone" in conflict for conflict in conflicts)
+    assert any(conflict.startswith("B/p4 65530-65539 is outside") for conflict in conflicts)
+
+
+def test_allocate_reuses_freed_gaps():
+    allocator = AddressAllocator(size=100)
+    assert allocator.Load({'A': {'p1': Decl('Pump', 0), 'p2': Decl('Pump', 10), 'p3': Decl('Pump', 20)}}, DEFINITIONS) == []
+    allocator.Free('A/p2')
+    assert allocator.Allocate('A/s1', 4) == 10
+    assert allocator.Allocate('A/s2', 6) == 14
+    assert allocator.Allocate('A/big', 71) is None
+    assert allocator.End() == 30
+
+
+def test_resequence_packs_and_steps_over_other_devices():
+    allocator = AddressAllocator(size=100)
+    allocator.Load({'A': {'p1': Decl('Pump', 0), 'p2': Decl('Pump', 30), 's1': Decl('Sensor', 12), 'p3': Decl('Pump', 50)}}, DEFINITIONS)
+    assert allocator.Resequence(['A/p1', 'A/p2', 'A/p3']) == {'A/p1': 0, 'A/p2': 16, 'A/p3': 26}
+    assert allocator.Address('A/s1') == 12
+    assert allocator.Space(0).starts == [0, 12, 16, 26]
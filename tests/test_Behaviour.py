@@ -0,0 +1,53 @@
+import pytest
+
+from Behaviour import BehaviourTable
+
+RULES = [
+    {"Command": 5, "Write": [["Status02", 8, 10, 1]]},
+    {"Command": 8, "When": [["Status02", 11, 11, 1]], "Write": [["Status02", 0, 2, 2]]},
+    {"Command": 8, "When": [["Status02", 11, 11, 0]], "Write": [["Status02", 0, 2, 4]]},
+    {"Command": 9, "Write": [["Status01", 15, 15, 1]]},
+    {"Command": 9, "Edge": "Falling", "Write": [["Status01", 15, 15, 0]]},
+]
+
+
+def test_masks():
+    table = BehaviourTable(RULES)
+    assert table.RisingMask == (1 << 5) | (1 << 8) | (1 << 9)
+    assert table.FallingMask == 1 << 9
+
+
+def test_writes_replace_the_field():
+    table = BehaviourTable(RULES)
+    assert table.Evaluate(1 << 5, 0, [0, 0b111 << 8]) == [0, 1 << 8]
+
+
+def test_conditions_select_the_rule():
+    table = BehaviourTable(RULES)
+    assert table.Evaluate(1 << 8, 0, [0, 1 << 11]) == [0, (1 << 11) | 2]
+    assert table.Evaluate(1 << 8, 0, [0, 0]) == [0, 4]
+
+
+def test_edges_and_unmapped_bits():
+    table = BehaviourTable(RULES)
+    assert table.Evaluate(1 << 9, 0, [0, 0]) == [1 << 15, 0]
+    assert table.Evaluate(0, 1 << 9, [1 << 15, 0]) == [0, 0]
+    assert table.Evaluate(1 << 3, 1 << 5, [7, 7]) == [7, 7]
+
+
+def test_rules_see_earlier_writes():
+    table = BehaviourTable([
+        {"Command": 0, "Write": [["Status02", 11, 11, 1]]},
+        {"Command": 1, "When": [["Status02", 11, 11, 1]], "Write": [["Status02", 0, 0, 1]]},
+    ])
+    assert table.Evaluate(0b11, 0, [0, 0]) == [0, (1 << 11) | 1]
+
+
+@pytest.mark.parametrize("rule", [
+    {"Command": 16, "Write": []},
+    {"Command": 0, "Write": [["Control01", 0, 0, 1]]},
+    {"Command": 0, "Write": [["Status01", 0, 1, 4]]},
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        BehaviourTable([rule])
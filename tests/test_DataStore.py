@@ -0,0 +1,23 @@
+from DataStore import CONTEXT_OFFSET, RegisterBank
+
+
+def test_dense_bank_serves_only_mapped_ranges():
+    bank = RegisterBank(100 + CONTEXT_OFFSET, 30, False)
+    bank.Map(100, 10)
+    bank.Map(120, 10)
+    assert bank.validate(100 + CONTEXT_OFFSET, 10)
+    assert not bank.validate(110 + CONTEXT_OFFSET)
+    assert not bank.validate(105 + CONTEXT_OFFSET, 10)
+    assert not bank.validate(99 + CONTEXT_OFFSET)
+    bank.Unmap(120, 10)
+    assert not bank.validate(125 + CONTEXT_OFFSET)
+
+
+def test_resized_bank_maps_only_the_new_device():
+    bank = RegisterBank(100 + CONTEXT_OFFSET, 10)
+    bank.SetRegister(105, 7)
+    bank.Resize(200 + CONTEXT_OFFSET, 5)
+    bank.Map(200, 5)
+    assert bank.GetRegister(105) == 7
+    assert bank.validate(200 + CONTEXT_OFFSET, 5) and bank.validate(100 + CONTEXT_OFFSET, 10)
+    assert not bank.validate(150 + CONTEXT_OFFSET)
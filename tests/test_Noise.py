@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from DataStore import RegisterBank
+from Noise import NoiseStage
+
+
+def Tag(address, codec='int', decimalPoints=0):
+    return SimpleNamespace(Address=address, Codec=codec, decimalPoints=decimalPoints, inverse=False)
+
+
+def Run(seed, keys, updates=3):
+    bank = RegisterBank(0, 100)
+    stage = NoiseStage(seed)
+    for index, key in enumerate(keys):
+        stage.Add(bank, Tag(10 * int(key[-1])), 100, 50, key=key)
+    history = []
+    for update in range(updates):
+        stage.Update()
+        history.append(bank.GetRegisters(0, 100).copy())
+    return np.array(history)
+
+
+def test_same_seed_replays():
+    assert (Run(7, ['a0', 'a1', 'a2']) == Run(7, ['a0', 'a1', 'a2'])).all()
+
+
+def test_streams_do_not_depend_on_creation_order():
+    assert (Run(7, ['a0', 'a1', 'a2']) == Run(7, ['a2', 'a0', 'a1'])).all()
+
+
+def test_other_seed_differs():
+    assert (Run(7, ['a0', 'a1']) != Run(8, ['a0', 'a1'])).any()
+
+
+def test_values_stay_within_amplitude():
+    history = Run(3, ['a0', 'a1', 'a2'], updates=50)[:, [0, 10, 20]]
+    assert history.min() >= 50 and history.max() <= 150
+    assert len(np.unique(history)) > 3
+
+
+def test_set_and_remove():
+    bank = RegisterBank(0, 10)
+    stage = NoiseStage(1)
+    kept = stage.Add(bank, Tag(0), 100, 5, key='kept')
+    removed = stage.Add(bank, Tag(1), 100, 5, key='removed')
+    stage.Set(kept, base=500, amplitude=0)
+    stage.Remove(removed)
+    stage.Update()
+    assert bank.GetRegisters(0, 2).tolist() == [500, 0]
+    assert len(stage) == 1
+    assert stage.Add(bank, Tag(2), 1, 0, key='reused') == removed
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from DataStore import RegisterBank, RegisterImage
+from Profiler import ProfileRecord
+from Scheduler import Scheduler, SimClock
+
+
+def Record():
+    image = RegisterImage(RegisterBank(0, 10), 0, 10)
+    return ProfileRecord(SimpleNamespace(Key='A/d', Name='d', Type='T', Image=image)), image
+
+
+def test_only_passes_and_jobs_count_register_traffic():
+    record, image = Record()
+    mark = record.Mark()
+    image.GetRegister(1)
+    image.SetRegister(2, 5)
+    record.Add(0.001, mark)
+    #Reads from outside the simulation, like the UI polling the selected device
+    image.GetRegister(1)
+    image.GetRegister(2)
+    stats = record.Stats()
+    assert (stats["Reads"], stats["Writes"]) == (1, 1)
+
+
+def test_job_traffic_is_counted_for_its_owner():
+    record, image = Record()
+    clock = SimClock('step', tick=1)
+    scheduler = Scheduler(clock)
+    job = scheduler.After(0, lambda: image.SetRegister(3, image.GetRegister(3) + 1))
+    job.Owner = record
+    scheduler.RunDue()
+    stats = record.Stats()
+    assert (stats["Job Calls"], stats["Reads"], stats["Writes"]) == (1, 1, 1)
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from RegisterMap import RegisterMap
+
+DEFINITIONS = {'Pump': {'Registers': 6, 'Status01': ['Running'], 'Status02': None, 'Control01': ['Start'],
+                        'Analog': [{'type': 'int', 'dp': 1}], 'Settings': [{'type': 'float'}]}}
+PLACES = {'Intake': {'p1': {'type': 'Pump', 'address': 0, 'settings': [1.5]},
+                     'p2': {'type': 'Pump', 'address': 10, 'settings': None}}}
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'devices.json').write_text(json.dumps(DEFINITIONS))
+    (tmp_path / 'places.json').write_text(json.dumps(PLACES))
+    return tmp_path
+
+
+def Load(project, compiled):
+    def compile(key):
+        compiled.append(key)
+        placesDecl = json.loads((project / 'places.json').read_text())
+        return RegisterMap.Compile(placesDecl, DEFINITIONS, {'Intake': 0}, key)
+    sources = [str(project / 'devices.json'), str(project / 'places.json')]
+    return RegisterMap.Cached(str(project / 'registermap'), sources, compile)
+
+
+def test_compiled_image():
+    registerMap = RegisterMap.Compile(PLACES, DEFINITIONS, {'Intake': 0})
+    assert registerMap.Keys == ['Intake/p1', 'Intake/p2']
+    address, words = registerMap.DeviceImage('Intake/p1')
+    assert address == 0 and words[4:6].tolist() == [0, 0x3FC0]
+    assert registerMap.Image(0)[0] == 0 and len(registerMap.Image(0)[1]) == 16
+
+
+def test_cache_is_reused_until_the_layout_changes(project):
+    compiled = []
+    first = Load(project, compiled)
+    second = Load(project, compiled)
+    assert len(compiled) == 1
+    assert second.Key == first.Key and isinstance(second.image, np.memmap)
+    #Simulate flags are run state, they keep the cache
+    places = json.loads((project / 'places.json').read_text())
+    places['Intake']['p1']['simulate'] = True
+    (project / 'places.json').write_text(json.dumps(places, indent=4))
+    Load(project, compiled)
+    assert len(compiled) == 1
+    places['Intake']['p2']['address'] = 20
+    (project / 'places.json').write_text(json.dumps(places))
+    moved = Load(project, compiled)
+    assert len(compiled) == 2
+    assert moved.DeviceImage('Intake/p2')[0] == 20
+
+
+def test_interrupted_save_is_not_loaded(project):
+    compiled = []
+    Load(project, compiled)
+    (project / 'registermap' / 'map.json').unlink()
+    Load(project, compiled)
+    assert len(compiled) == 2
+
+
+def test_save_keeps_a_mapped_cache_readable(project):
+    compiled = []
+    Load(project, compiled)
+    mapped = Load(project, compiled)
+    words = mapped.image.tolist()
+    places = json.loads((project / 'places.json').read_text())
+    places['Intake']['p2']['address'] = 20
+    (project / 'places.json').write_text(json.dumps(places))
+    Load(project, compiled)
+    assert mapped.image.tolist() == words
+
+
+def test_devices_are_built_from_the_mapped_tags(tmp_path):
+    import os
+    import Nuwans_ModBus_Sim2_v001 as App
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, 'devices.json')) as fp:
+        definitions = json.load(fp)
+    with open(os.path.join(root, 'places.json')) as fp:
+        places = json.load(fp)
+    App.Plant.CompileMap(places, definitions).Save(str(tmp_path))
+    registerMap = RegisterMap.Load(str(tmp_path), '')
+    plant = App.Plant(places, definitions, registerMap=registerMap)
+    tags = lambda device: [(type(tag), tag.Address, getattr(tag, 'decimalPoints', None), getattr(tag, 'inverse', None))
+                           for tag in [device.Status01, device.Status02, device.Control01] + device.Analog + device.Settings if tag]
+    for place, devicesDecl in places.items():
+        for name, deviceDecl in devicesDecl.items():
+            device = plant.GetDevice(f"{place}/{name}")
+            built = App.Device(deviceDecl, definitions, device.Image.bank, device.Key, False)
+            assert tags(device) == tags(built)
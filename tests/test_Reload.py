@@ -0,0 +1,95 @@
+import copy
+
+import pytest
+
+from Reload import PlantDiff
+
+DEFINITIONS = {'Pump': {'Registers': 10}, 'Valve': {'Registers': 5}}
+PLACES = {
+    'Intake': {
+        'p1': {'type': 'Pump', 'address': 0, 'name': 'Pump 1'},
+        'p2': {'type': 'Pump', 'address': 10, 'name': 'Pump 2'},
+        'v1': {'type': 'Valve', 'address': 20, 'name': 'Valve 1'},
+    },
+    'Outlet': {'v2': {'type': 'Valve', 'address': 0, 'name': 'Valve 2'}},
+}
+
+
+def Diff(places=None, definitions=None):
+    return PlantDiff(PLACES, DEFINITIONS, places or PLACES, definitions or DEFINITIONS)
+
+
+def test_no_changes():
+    plan = Diff(copy.deepcopy(PLACES), copy.deepcopy(DEFINITIONS))
+    assert len(plan) == 0
+    assert plan.Places == set() and plan.Types == set()
+
+
+def test_move_add_remove():
+    places = copy.deepcopy(PLACES)
+    places['Intake']['p2']['address'] = 40
+    places['Intake']['p3'] = {'type': 'Pump', 'address': 50, 'name': 'Pump 3'}
+    del places['Intake']['v1']
+    plan = Diff(places)
+    assert plan.Moved == ['Intake/p2']
+    assert plan.Added == ['Intake/p3']
+    assert plan.Removed == ['Intake/v1']
+    assert plan.Places == {'Intake'}
+    assert plan.Stopped() == ['Intake/v1', 'Intake/p2']
+    assert plan.Created() == ['Intake/p3', 'Intake/p2']
+
+
+def test_removed_place():
+    places = copy.deepcopy(PLACES)
+    del places['Outlet']
+    plan = Diff(places)
+    assert plan.Removed == ['Outlet/v2']
+    assert len(plan) == 1
+
+
+def test_type_change_replaces_and_other_changes_update():
+    places = copy.deepcopy(PLACES)
+    places['Intake']['p1']['type'] = 'Valve'
+    places['Intake']['p1']['address'] = 60
+    places['Outlet']['v2']['name'] = 'Outlet Valve'
+    plan = Diff(places)
+    assert plan.Replaced == ['Intake/p1']
+    assert plan.Moved == []
+    assert plan.Updated == ['Outlet/v2']
+    assert plan.Places == {'Intake', 'Outlet'}
+
+
+def test_changed_definition_replaces_its_devices():
+    definitions = copy.deepcopy(DEFINITIONS)
+    definitions['Valve']['Registers'] = 6
+    plan = Diff(definitions=definitions)
+    assert plan.Types == {'Valve'}
+    assert plan.Replaced == ['Intake/v1', 'Outlet/v2']
+
+
+def test_reload_applies_updated_simscale_and_settings():
+    import json
+    import os
+    import Nuwans_ModBus_Sim2_v001 as App
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, 'devices.json')) as fp:
+        definitions = json.load(fp)
+    with open(os.path.join(root, 'places.json')) as fp:
+        places = json.load(fp)
+    plant = App.Plant(copy.deepcopy(places), definitions)
+    engine = App.SimEngine()
+    sensor = plant.GetDevice('Intake/Main_PIT')
+    engine.add_simulator(sensor)
+    channel = sensor.Simulator.simObj.channels[0]
+    amplitude = engine.noise.amplitude[channel]
+    newPlaces = copy.deepcopy(places)
+    newPlaces['Intake']['Main_PIT']['simscale'] = 0.5
+    settings = newPlaces['Intake']['Main_Pump_01']['settings']
+    newPlaces['Intake']['Main_Pump_01']['settings'] = [value + 1 for value in settings]
+    plan = PlantDiff(plant.PlacesDecl, plant.Definitions, newPlaces, definitions)
+    assert plan.Updated == ['Intake/Main_Pump_01', 'Intake/Main_PIT']
+    engine.reload_plant(plant, plan, newPlaces, definitions, App.Plant.CompileMap(newPlaces, definitions))
+    assert plant.GetDevice('Intake/Main_PIT') is sensor and sensor.SimScale == 0.5
+    assert engine.noise.amplitude[channel] == pytest.approx(amplitude * (0.5 / 0.75) ** 2)
+    pump = plant.GetDevice('Intake/Main_Pump_01')
+    assert [setting.Value for setting in pump.Settings] == pytest.approx([value + 1 for value in settings])